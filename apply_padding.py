@@ -1,5 +1,7 @@
 import numpy as np
 
+from boundary import BOUNDARY_MODES, extend
+
 def padarray(A, padsize, padval=0, direction="both", mode="constant"):
     """
     Pads an array with specified padding size and value.
@@ -9,7 +11,7 @@ def padarray(A, padsize, padval=0, direction="both", mode="constant"):
     - padsize (tuple or list): Number of rows/columns to pad in each dimension.
     - padval (int, float, or str): Padding value or method ('circular', 'replicate', 'reflect', 'symmetric').
     - direction (str): 'pre', 'post', or 'both' (default: 'both').
-    - mode (str): Padding mode for numpy.pad (default: 'constant').
+    - mode (str): Unused, kept for backward compatibility (the mode follows padval).
 
     Returns:
     - numpy.ndarray: Padded array.
@@ -31,20 +33,8 @@ def padarray(A, padsize, padval=0, direction="both", mode="constant"):
     else:
         raise ValueError("Invalid direction. Choose from 'pre', 'post', 'both'.")
 
-    # Handle different padding modes
-    if isinstance(padval, str):  # If padval is a mode (e.g., 'replicate', 'symmetric')
-        if padval == "circular":
-            mode = "wrap"
-        elif padval == "replicate":
-            mode = "edge"
-        elif padval == "reflect":
-            mode = "reflect"
-        elif padval == "symmetric":
-            mode = "symmetric"
-        else:
-            raise ValueError(f"Unknown padding mode: {padval}")
-
-        return np.pad(A, pad_width, mode=mode)
-
-    # Default: Constant padding with specified value
-    return np.pad(A, pad_width, mode="constant", constant_values=padval)
+    # Strings name a boundary mode ('circular', 'replicate', 'reflect', 'symmetric'),
+    # numbers are a constant padding value
+    if isinstance(padval, str) and padval.lower() not in BOUNDARY_MODES:
+        raise ValueError(f"Unknown padding mode: {padval}")
+    return extend(A, pad_width, padval)
@@ -0,0 +1,371 @@
+import os
+import json
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+from is_image import is_image
+from im_cast import imcast
+from im_noise import im_noise
+from pad_for_sliding_filter import pad_for_sliding_filter
+from im_smooth import imsmooth
+from boundary import boundary_mode
+from variational_denoiser import variational_denoiser
+from perona_malik import perona_malik
+from metrics import METRICS, compare
+import instrumentation
+from instrumentation import stage
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")
+METHODS = ("variational", "perona_malik", "average", "median", "bilateral")
+
+# Same parameters as the single-image run in main.py
+DEFAULT_CONFIG = {
+    "noise": ("gaussian", 0.2, 0.1),
+    # Boundary of the pre-smoothing, filters and PDE solvers, treated inside each of them (see
+    # boundary.py); a number is a constant on the 0-255 scale
+    "boundary": "replicate",
+    # Optional pre-padding window: if set, the noisy image is first zero-padded for this window,
+    # as main.py used to do, and the outputs are cropped back (None: no padded copy)
+    "window_size": None,
+    # True: denoise colour images on all channels at once (channel-coupled diffusion) instead of
+    # their grayscale mean
+    "color": False,
+    "presmooth_sigma": 1.5,
+    "variational": (150, 3, 0.05, 0.999, 0.99, 0.01, 0.00005, 50),
+    "perona_malik": {"iterations": 20, "K": 10, "lambda_": 0.05},
+    "average": ((3, 3),),
+    "median": ((3, 3),),
+    "bilateral": (2, 10 / 255),
+    "methods": METHODS,
+    # Working precision from decode to encode: 'single' (float32), 'double' (float64) or None for
+    # the uint8/float64 mix of main.py
+    "precision": "single",
+    # Quality metrics against the clean image, out of metrics.METRICS
+    "metrics": ("NE",),
+}
+
+
+def iter_inputs(source):
+    """
+    Lists the images referenced by a directory or a manifest file.
+
+    Parameters:
+    - source (str): Directory of images, or a text manifest with one image path per line
+      (relative paths are resolved against the manifest's directory, '#' starts a comment).
+
+    Returns:
+    - list of str: Image paths in processing order.
+    """
+    if os.path.isdir(source):
+        names = sorted(f for f in os.listdir(source) if f.lower().endswith(IMAGE_EXTENSIONS))
+        return [os.path.join(source, f) for f in names]
+
+    if not os.path.isfile(source):
+        raise ValueError(f"iter_inputs: '{source}' is neither a directory nor a manifest file")
+
+    base = os.path.dirname(os.path.abspath(source))
+    paths = []
+    with open(source) as fh:
+        for line in fh:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                paths.append(line if os.path.isabs(line) else os.path.join(base, line))
+    return paths
+
+
+def read_image(path):
+    """Decodes an image from disk, raising instead of returning None on failure."""
+    import cv2
+
+    I = cv2.imread(path)
+    if not is_image(I):
+        raise ValueError(f"read_image: Could not decode '{path}'")
+    return I
+
+
+def denoise_pipeline(I, config=None):
+    """
+    Runs the noise -> imsmooth -> PDE/filter -> metrics pipeline of main.py on one image.
+
+    Parameters:
+    - I (numpy.ndarray): Clean input image (grayscale or BGR, uint8).
+    - config (dict, optional): Overrides for DEFAULT_CONFIG.
+
+    Returns:
+    - tuple: (outputs, metrics) where outputs maps 'noised' and each method name to an
+      image cropped back to the input size, and metrics maps the same keys to
+      {metric: value} for the metrics of config['metrics'].
+    """
+    cfg = dict(DEFAULT_CONFIG)
+    if config:
+        cfg.update(config)
+
+    precision = cfg["precision"]
+    if precision not in (None, "single", "double"):
+        raise ValueError(f"denoise_pipeline: Unknown precision '{precision}'")
+
+    _check_boundary(cfg["methods"], cfg["boundary"], "denoise_pipeline")
+
+    noise_type, *noise_args = cfg["noise"]
+    with stage("noise"):
+        A = im_noise(I, noise_type, *noise_args)
+
+    with stage("normalize"):
+        gray = I.ndim == 3 and not cfg["color"]
+        if precision is None:
+            if gray:  # Noise is added before the grayscale conversion, as in main.py
+                I = np.mean(I, axis=2).astype(np.uint8)
+                A = np.mean(A, axis=2).astype(np.uint8)
+        else:
+            # The only conversion to floating point; everything up to the encoder stays in [0, 1]
+            I, A = imcast(I, precision), imcast(A, precision)
+            if gray:
+                I, A = I.mean(axis=2, dtype=I.dtype), A.mean(axis=2, dtype=A.dtype)
+    dtype = np.float64 if precision is None else I.dtype
+    float_args = {} if precision is None else {"dtype": dtype, "quantize": False}
+
+    boundary = cfg["boundary"]
+    if precision is not None and not isinstance(boundary, str):
+        boundary = boundary / 255  # Constant boundaries are given on the 0-255 scale
+    edges = {"boundary": boundary}
+    if I.ndim == 3:  # Interleaved colour channels, filtered and diffused together
+        edges["channel_axis"] = -1
+
+    window_size = cfg["window_size"]
+    A_padded = A
+    if window_size is not None:
+        window_size = tuple(window_size) + (1,) * (A.ndim - len(window_size))
+        with stage("pad"):
+            A_padded = pad_for_sliding_filter(A, window_size, padval=0)
+    with stage("presmooth"):
+        A_smooth = imsmooth(A_padded, "gaussian", cfg["presmooth_sigma"], dtype=dtype, **edges)
+
+    outputs = {"noised": A}
+    for method in cfg["methods"]:
+        with stage(method):
+            args = cfg[method] if precision is None else _rescaled(method, cfg[method])
+            if method == "variational":
+                J = variational_denoiser(A_smooth, *args, **float_args, **edges)
+                if A_smooth.ndim == 2:
+                    J = J[:, :, 0]  # variational_denoiser always returns a channel axis
+            elif method == "perona_malik":
+                J = perona_malik(A_smooth, **args, **float_args, **edges)
+            elif method in ("average", "median", "bilateral"):
+                J = imsmooth(A_smooth, method, *args, dtype=dtype, **edges)
+            else:
+                raise ValueError(f"denoise_pipeline: Unknown method '{method}'")
+        outputs[method] = J
+
+    if window_size is not None:
+        # pad_for_sliding_filter pads floor(w/2) on both sides, minus one leading row/column for even w
+        pre = [w // 2 - (1 - w % 2) for w in window_size]
+        crop = tuple(slice(p, p + n) for p, n in zip(pre, I.shape))
+        for method in cfg["methods"]:
+            outputs[method] = outputs[method][crop]
+
+    peak = 255.0 if precision is None else 1.0
+    with stage("metrics"):
+        metrics = compare(I, outputs, peak, cfg["metrics"], dtype)
+    return outputs, metrics
+
+
+def _check_boundary(methods, boundary, caller):
+    """
+    Fails before any processing if one of the methods cannot extend the image with boundary:
+    the bilateral filter (OpenCV) has no circular or non-zero constant border.
+    """
+    name, cval = boundary_mode(boundary)
+    if "bilateral" in methods and (name == "circular" or (name == "constant" and cval != 0)):
+        raise ValueError(f"{caller}: The bilateral filter does not support the boundary '{boundary}'; "
+                         "choose another boundary or leave bilateral out of the methods")
+
+
+def _rescaled(method, args):
+    """
+    Parameters of main.py, which are tuned for data on the 0-255 scale, rewritten for data in
+    [0, 1] so that the normalized pipeline computes the same model.
+    """
+    if method == "variational":  # Edge weights use sqrt(beta*||c||^2 + gamma) and neta
+        alpha, k, neta, beta, gamma, nu, lambda_, N = args
+        return alpha, k, neta / 255, beta, gamma / 255 ** 2, nu, lambda_, N
+    if method == "perona_malik":
+        return {**args, "K": args.get("K", 15) / 255}
+    if method == "bilateral":  # imsmooth scales sigma_r by 255 for 0-255 data
+        sigma_d, sigma_r = args
+        return sigma_d, sigma_r / 255
+    return args
+
+
+def _to_uint8(J, normalized):
+    if J.dtype == np.uint8:
+        return J
+    if normalized:
+        return imcast(J, "uint8")  # The pipeline's single quantization step
+    return np.clip(np.rint(J), 0, 255).astype(np.uint8)
+
+
+def _process(name, I, config, output_dir):
+    with stage("image", image=name):
+        outputs, metrics = denoise_pipeline(I, config)
+        if output_dir is None:
+            return name, outputs, metrics
+
+        stem = os.path.splitext(os.path.basename(name))[0]
+        normalized = {**DEFAULT_CONFIG, **(config or {})}["precision"] is not None
+        import cv2
+
+        with stage("write"):
+            for method, J in outputs.items():
+                cv2.imwrite(os.path.join(output_dir, f"{stem}_{method}.png"), _to_uint8(J, normalized))
+    return name, None, metrics
+
+
+def _init_worker_events(events_path, track_memory):
+    instrumentation.add_listener(instrumentation.JsonLinesSink(events_path))
+    instrumentation.enable_memory_tracking(track_memory)
+
+
+def denoise_stream(items, config=None, output_dir=None, workers=None, prefetch=2, events_path=None,
+                   track_memory=False):
+    """
+    Denoises a stream of images on a bounded process pool, yielding results in input order.
+
+    Parameters:
+    - items (iterable): (name, image) pairs; images are decoded numpy arrays.
+    - config (dict, optional): Overrides for DEFAULT_CONFIG.
+    - output_dir (str, optional): If given, workers write '<stem>_<method>.png' there and
+      only metrics are sent back.
+    - workers (int, optional): Number of worker processes (default: os.cpu_count()); 0 runs inline.
+    - prefetch (int): Extra images queued per worker beyond the one being processed.
+    - events_path (str, optional): JSON lines file receiving the instrumentation events of every
+      worker (per-stage and per-iteration timings).
+    - track_memory (bool): Also record bytes allocated per stage (slower; see instrumentation).
+
+    Yields:
+    - tuple: (name, outputs or None, metrics).
+    """
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+
+    if workers == 0:
+        sink = None
+        if events_path is not None:
+            sink = instrumentation.add_listener(instrumentation.JsonLinesSink(events_path))
+            instrumentation.enable_memory_tracking(track_memory)
+        try:
+            for name, I in items:
+                yield _process(name, I, config, output_dir)
+        finally:
+            if sink is not None:
+                instrumentation.remove_listener(sink)
+                sink.close()
+        return
+
+    workers = workers or os.cpu_count() or 1
+    max_pending = workers * (1 + max(prefetch, 0))
+    pending = deque()
+    init = (_init_worker_events, (events_path, track_memory)) if events_path is not None else (None, ())
+    with ProcessPoolExecutor(max_workers=workers, initializer=init[0], initargs=init[1]) as pool:
+        for name, I in items:
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+            pending.append(pool.submit(_process, name, I, config, output_dir))
+        while pending:
+            yield pending.popleft().result()
+
+
+def _decoded(paths, prefetch):
+    # Decode ahead of the pool on a thread; cv2.imread releases the GIL
+    with ThreadPoolExecutor(max_workers=1) as reader:
+        pending = deque()
+        for path in paths:
+            if len(pending) > prefetch:
+                path_done, future = pending.popleft()
+                yield path_done, future.result()
+            pending.append((path, reader.submit(read_image, path)))
+        while pending:
+            path_done, future = pending.popleft()
+            yield path_done, future.result()
+
+
+def batch_denoise(source, output_dir, config=None, workers=None, prefetch=2, events_path=None,
+                  track_memory=False):
+    """
+    Denoises every image of a directory or manifest and writes outputs and metrics.
+
+    Parameters:
+    - source (str): Directory or manifest file (see iter_inputs).
+    - output_dir (str): Folder receiving the denoised images and 'metrics.jsonl'.
+    - config (dict, optional): Overrides for DEFAULT_CONFIG.
+    - workers (int, optional): Number of worker processes (default: os.cpu_count()); 0 runs inline.
+    - prefetch (int): Number of images decoded ahead per worker.
+    - events_path, track_memory: Instrumentation options (see denoise_stream).
+
+    Returns:
+    - list of dict: One metrics record per image, in input order.
+    """
+    paths = iter_inputs(source)
+    os.makedirs(output_dir, exist_ok=True)
+    n_workers = workers if workers is not None else (os.cpu_count() or 1)
+
+    records = []
+    with open(os.path.join(output_dir, "metrics.jsonl"), "w") as fh:
+        items = _decoded(paths, prefetch * max(n_workers, 1))
+        for name, _, metrics in denoise_stream(items, config, output_dir, workers, prefetch,
+                                                events_path, track_memory):
+            record = {"image": name, **{f"{m}_{k}": v for k, values in metrics.items()
+                                        for m, v in values.items()}}
+            fh.write(json.dumps(record) + "\n")
+            fh.flush()
+            records.append(record)
+    return records
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch PDE denoising of a directory or manifest of images.")
+    parser.add_argument("source", help="directory of images or manifest file (one path per line)")
+    parser.add_argument("-o", "--output-dir", default="results", help="output folder (default: results)")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="worker processes (default: CPU count, 0 = run inline)")
+    parser.add_argument("--prefetch", type=int, default=2, help="images decoded ahead per worker (default: 2)")
+    parser.add_argument("--methods", nargs="+", choices=METHODS, default=list(METHODS),
+                        help="denoising methods to run (default: all)")
+    parser.add_argument("--precision", choices=("single", "double", "legacy"), default="single",
+                        help="working precision from decode to encode (default: single)")
+    parser.add_argument("--boundary", default="replicate",
+                        help="image edge handling: replicate, symmetric, reflect, circular or a constant "
+                             "(default: replicate); bilateral supports neither circular nor a non-zero constant")
+    parser.add_argument("--pre-pad", type=int, nargs=2, default=None, metavar=("ROWS", "COLS"),
+                        help="zero-pad the noisy image for this window first, as main.py used to")
+    parser.add_argument("--color", action="store_true",
+                        help="denoise colour images on all channels together instead of their grayscale mean")
+    parser.add_argument("--metrics", nargs="+", choices=METRICS, default=["NE"],
+                        help="quality metrics to record (default: NE)")
+    parser.add_argument("--events", default=None,
+                        help="write per-stage and per-iteration timing events to this JSON lines file")
+    parser.add_argument("--track-memory", action="store_true", help="also record bytes allocated per stage")
+    args = parser.parse_args(argv)
+
+    try:
+        boundary = float(args.boundary)
+    except ValueError:
+        boundary = args.boundary
+    try:
+        _check_boundary(args.methods, boundary, "batch_denoise")
+    except ValueError as e:
+        parser.error(str(e))
+    config = {"methods": tuple(args.methods), "metrics": tuple(args.metrics),
+              "boundary": boundary, "window_size": args.pre_pad, "color": args.color,
+              "precision": None if args.precision == "legacy" else args.precision}
+    records = batch_denoise(args.source, args.output_dir, config,
+                            workers=args.workers, prefetch=args.prefetch,
+                            events_path=args.events, track_memory=args.track_memory)
+    for record in records:
+        print(json.dumps(record))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,419 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+import tracemalloc
+
+import numpy as np
+
+from apply_padding import padarray
+from pad_for_sliding_filter import pad_for_sliding_filter
+from kernel import fspecial
+from median_filter import median_filter
+from im_noise import im_noise
+from im_smooth import imsmooth
+from metrics import noise_estimation_error
+from perona_malik import perona_malik
+from perona_malik_aos import perona_malik_aos
+from perona_malik_tiled import perona_malik_tiled
+from variational_denoiser import variational_denoiser, variational_pyramid
+
+DEFAULT_SIZES = (256, 1024, 2048)
+ALL_SIZES = (256, 512, 1024, 2048, 4096, 8192)
+DTYPES = ("uint8", "float32", "float64")
+
+# Modules imported by library users and worker processes, and the dependencies they must only
+# import on first use
+LIBRARY_MODULES = ("main", "batch_denoise", "parameter_sweep", "pipeline_graph", "out_of_core",
+                   "result_cache", "metrics", "kernel", "im_smooth", "im_cast", "is_image",
+                   "perona_malik_tiled", "perona_malik_aos", "variational_denoiser", "video_denoise")
+HEAVY_MODULES = ("cv2", "scipy", "matplotlib")
+# Import time of a module in a fresh interpreter, numpy included, in seconds
+IMPORT_BUDGET = 0.3
+
+# name -> (callable(image, threads), uses_threads); images hold values on the 0-255 scale
+CASES = {
+    "fspecial_gaussian": (lambda I, t: fspecial("gaussian", 25, 4.0), False),
+    "fspecial_log": (lambda I, t: fspecial("log", 25, 4.0), False),
+    "fspecial_disk": (lambda I, t: fspecial("disk", 25), False),
+    "imsmooth_gaussian": (lambda I, t: imsmooth(I, "gaussian", 1.5), False),
+    "imsmooth_average": (lambda I, t: imsmooth(I, "average", (3, 3)), False),
+    "imsmooth_disk": (lambda I, t: imsmooth(I, "disk", 5), False),
+    "imsmooth_median": (lambda I, t: imsmooth(I, "median", (3, 3)), False),
+    "imsmooth_median_15": (lambda I, t: imsmooth(I, "median", (15, 15)), False),
+    "imsmooth_bilateral": (lambda I, t: imsmooth(I, "bilateral", 2, 10 / 255), False),
+    "imsmooth_gaussian_tiled": (lambda I, t: imsmooth(I, "gaussian", 1.5, workers=t), True),
+    "imsmooth_median_tiled": (lambda I, t: imsmooth(I, "median", (3, 3), workers=t), True),
+    "im_noise_gaussian": (lambda I, t: im_noise(I, "gaussian", 0.2, 0.1), False),
+    "im_noise_salt_pepper": (lambda I, t: im_noise(I, "salt & pepper", 0.05), False),
+    "im_noise_gaussian_seeded": (lambda I, t: im_noise(I, "gaussian", 0.2, 0.1, seed=0, workers=t), True),
+    "padarray": (lambda I, t: padarray(I, (2, 2), "replicate"), False),
+    "pad_for_sliding_filter": (lambda I, t: pad_for_sliding_filter(I, (5, 5), padval=0), False),
+    "perona_malik": (lambda I, t: perona_malik(I, iterations=20, K=10, lambda_=0.05), False),
+    "perona_malik_tiled": (lambda I, t: perona_malik_tiled(I, iterations=20, K=10, lambda_=0.05,
+                                                           workers=t), True),
+    "variational_denoiser": (lambda I, t: variational_denoiser(
+        I, 150, 3, 0.05, 0.999, 0.99, 0.01, 0.00005, 50), False),
+}
+
+
+def synthetic_image(size, dtype, seed=0):
+    """Square test image with smooth structure plus noise, values on the 0-255 scale."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:size, 0:size] * (8 * np.pi / size)
+    I = 128 + 60 * np.sin(x) * np.cos(y) + rng.normal(0, 20, (size, size))
+    return np.clip(I, 0, 255).astype(dtype)
+
+
+def measure(func, repeat=3):
+    """
+    Times func (best of 'repeat' runs) and measures its peak traced memory in a separate run.
+
+    Returns:
+    - dict: 'seconds' and 'peak_bytes'.
+    """
+    func()  # Warm up
+    seconds = min(_timed(func) for _ in range(repeat))
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": seconds, "peak_bytes": peak}
+
+
+def _timed(func):
+    t0 = time.perf_counter()
+    func()
+    return time.perf_counter() - t0
+
+
+def run_suite(cases=None, sizes=DEFAULT_SIZES, dtypes=DTYPES, threads=(1,), repeat=3, seed=0):
+    """
+    Runs every selected case on synthetic images of every size and dtype.
+
+    Parameters:
+    - cases (iterable of str, optional): Names from CASES (default: all).
+    - sizes (iterable of int): Image side lengths.
+    - dtypes (iterable of str): Input dtypes.
+    - threads (iterable of int): Thread counts, swept for cases with a worker option.
+    - repeat (int): Timed runs per measurement; the fastest is kept.
+
+    Returns:
+    - dict: {'meta': environment description, 'results': list of records with 'case', 'size',
+      'dtype', 'threads', 'seconds', 'mpix_per_s' and 'peak_bytes'}.
+    """
+    cases = list(CASES) if cases is None else list(cases)
+    results = []
+    for size in sizes:
+        for dtype in dtypes:
+            I = synthetic_image(size, dtype, seed)
+            for name in cases:
+                call, uses_threads = CASES[name]
+                for t in (threads if uses_threads else (1,)):
+                    r = measure(lambda: call(I, t), repeat)
+                    results.append({"case": name, "size": size, "dtype": dtype, "threads": t, **r,
+                                    "mpix_per_s": size * size / r["seconds"] / 1e6})
+                    print(f"{name:>24} {size:>5}^2 {dtype:>7} x{t:<3} {r['seconds']:9.4f} s "
+                          f"{results[-1]['mpix_per_s']:9.1f} Mpix/s {r['peak_bytes'] / 2**20:9.1f} MiB",
+                          file=sys.stderr)
+
+    meta = {"python": platform.python_version(), "numpy": np.__version__,
+            "machine": platform.machine(), "cpus": os.cpu_count(), "repeat": repeat}
+    return {"meta": meta, "results": results}
+
+
+def compare(baseline, current, threshold=0.10):
+    """
+    Flags cases whose wall time grew by more than 'threshold' (relative) against a baseline.
+
+    Parameters:
+    - baseline, current (dict): Outputs of run_suite.
+    - threshold (float): Allowed relative slowdown.
+
+    Returns:
+    - list of dict: One entry per matching record with 'case', 'size', 'dtype', 'threads',
+      'baseline', 'current', 'ratio' and 'regression'.
+    """
+    key = lambda r: (r["case"], r["size"], r["dtype"], r["threads"])
+    base = {key(r): r for r in baseline["results"]}
+    report = []
+    for r in current["results"]:
+        b = base.get(key(r))
+        if b is None:
+            continue
+        ratio = r["seconds"] / b["seconds"]
+        report.append({"case": r["case"], "size": r["size"], "dtype": r["dtype"], "threads": r["threads"],
+                       "baseline": b["seconds"], "current": r["seconds"], "ratio": ratio,
+                       "regression": ratio > 1 + threshold})
+    return report
+
+
+def bench_perona_malik_engines(size=2048, iterations=20, dtype=np.float64, seed=0):
+    """Compares the 'reference' and 'inplace' Perona-Malik engines on a synthetic image."""
+    I = np.random.default_rng(seed).integers(0, 256, (size, size), dtype=np.uint8)
+    perona_malik(I[:64, :64], iterations=1)  # Warm up
+
+    results = {}
+    for engine in ("reference", "inplace"):
+        t0 = time.perf_counter()
+        perona_malik(I, iterations=iterations, engine=engine, dtype=dtype)
+        seconds = time.perf_counter() - t0
+        tracemalloc.start()
+        perona_malik(I, iterations=iterations, engine=engine, dtype=dtype)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[engine] = {"seconds": seconds, "peak_bytes": peak,
+                           "mpix_per_s": size * size * iterations / seconds / 1e6}
+    return results
+
+
+def bench_batch(size=256, batch_sizes=(1, 4, 16, 64), seed=0):
+    """
+    Throughput (frames per second) of the batched API against a per-frame loop, for
+    imsmooth('gaussian'), perona_malik and variational_denoiser.
+    """
+    calls = {
+        "imsmooth": lambda X, batch: imsmooth(X, "gaussian", 1.5, batch=batch),
+        "perona_malik": lambda X, batch: perona_malik(X, 20, 0.05, 10, batch=batch),
+        "variational_denoiser": lambda X, batch: variational_denoiser(
+            X, 150, 3, 0.05, 0.999, 0.99, 0.01, 0.00005, 50, batch=batch),
+    }
+    rng = np.random.default_rng(seed)
+    results = {}
+    for name, call in calls.items():
+        for B in batch_sizes:
+            X = rng.integers(0, 256, (B, size, size), dtype=np.uint8)
+            t0 = time.perf_counter()
+            for frame in X:
+                call(frame, False)
+            loop = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            call(X, True)
+            batched = time.perf_counter() - t0
+            results[(name, B)] = {"loop_fps": B / loop, "batch_fps": B / batched}
+    return results
+
+
+def bench_precision(size=512, seed=0):
+    """
+    Runs batch_denoise.denoise_pipeline in single and double precision on the same noisy input.
+
+    Returns:
+    - dict: {'seconds': {precision: wall time}, 'max_abs_diff': {output: largest absolute
+      difference between the float32 and float64 results, on the [0, 1] scale}}.
+    """
+    from batch_denoise import denoise_pipeline
+
+    I = synthetic_image(size, np.uint8, seed)
+    outputs, seconds = {}, {}
+    for precision in ("double", "single"):
+        np.random.seed(seed)  # Same noise for both runs
+        t0 = time.perf_counter()
+        outputs[precision], _ = denoise_pipeline(I, {"precision": precision})
+        seconds[precision] = time.perf_counter() - t0
+    diff = {name: float(np.max(np.abs(outputs["single"][name] - outputs["double"][name])))
+            for name in outputs["double"]}
+    return {"seconds": seconds, "max_abs_diff": diff}
+
+
+def bench_aos(size=1024, diffusion_time=5.0, lambda_=0.05, steps=(1, 2, 5, 10), K=10, seed=0):
+    """
+    Explicit Perona-Malik (diffusion_time / lambda_ iterations) against AOS reaching the same
+    diffusion time in the given numbers of steps.
+
+    Returns:
+    - dict: {'explicit': {'steps', 'seconds'}, steps: {'seconds', 'rms_diff'}}, where rms_diff is
+      the RMS difference from the explicit result in grey levels (the border rows and columns
+      differ by construction: periodic for the explicit scheme, reflecting for AOS).
+    """
+    I = synthetic_image(size, np.float64, seed)
+    iterations = int(round(diffusion_time / lambda_))
+    t0 = time.perf_counter()
+    ref = perona_malik(I, iterations, lambda_, K, quantize=False)
+    results = {"explicit": {"steps": iterations, "seconds": time.perf_counter() - t0}}
+    for n in steps:
+        t0 = time.perf_counter()
+        J = perona_malik_aos(I, diffusion_time, n, K, quantize=False)
+        results[n] = {"seconds": time.perf_counter() - t0, "rms_diff": float(np.sqrt(np.mean((J - ref) ** 2)))}
+    return results
+
+
+def bench_pyramid(size=1024, iterations=(50, 200, 400), N=10, levels=3, cycles=0, seed=0):
+    """
+    Plain variational_denoiser at several iteration counts against variational_pyramid, on a
+    presmoothed noisy synthetic image. Quality is the Noise Estimation Error (NE) against the
+    clean image, as in main.py.
+
+    Returns:
+    - dict: {label: {'fine_iterations', 'seconds', 'ne'}}.
+    """
+    params = (150, 3, 0.05, 0.999, 0.99, 0.01, 0.00005)
+    clean = synthetic_image(size, np.uint8, seed)
+    np.random.seed(seed)
+    A = imsmooth(im_noise(clean, "gaussian", 0.0, 0.01), "gaussian", 1.5)
+
+    results = {}
+    for n in iterations:
+        t0 = time.perf_counter()
+        J = variational_denoiser(A, *params, n)
+        results[f"plain N={n}"] = {"fine_iterations": n, "seconds": time.perf_counter() - t0,
+                                   "ne": noise_estimation_error(clean, J[:, :, 0])}
+    t0 = time.perf_counter()
+    J = variational_pyramid(A, *params, N, levels=levels, cycles=cycles)
+    results[f"pyramid L={levels}"] = {"fine_iterations": N * (1 + 2 * cycles),
+                                      "seconds": time.perf_counter() - t0,
+                                      "ne": noise_estimation_error(clean, J[:, :, 0])}
+    return results
+
+
+def bench_median(size=1024, windows=(3, 7, 15, 31), workers=1, seed=0):
+    """
+    Wall time of scipy.ndimage.median_filter against the constant-time histogram median on a
+    uint8 synthetic image, for square windows of the given sizes.
+    """
+    from scipy.ndimage import median_filter as scipy_median
+
+    I = synthetic_image(size, np.uint8, seed)
+    results = {}
+    for w in windows:
+        results[w] = {"scipy": _timed(lambda: scipy_median(I, size=w, mode="nearest")),
+                      "histogram": _timed(lambda: median_filter(I, w, workers=workers))}
+    return results
+
+
+def check_imports(modules=LIBRARY_MODULES, budget=IMPORT_BUDGET, repeat=3):
+    """
+    Imports each module in a fresh interpreter and records its import time (best of 'repeat',
+    from python -X importtime) and the heavy dependencies (HEAVY_MODULES) it pulled in.
+
+    Returns:
+    - dict: module -> {'seconds', 'heavy' (list), 'ok'}; ok is False if the import exceeded the
+      budget or loaded a heavy dependency.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    probe = ("import sys, {0}; print(','.join(sorted({{m.split('.')[0] for m in sys.modules}}"
+             " & set({1!r}))))")
+    results = {}
+    for module in modules:
+        seconds, heavy = float("inf"), []
+        for _ in range(repeat):
+            proc = subprocess.run([sys.executable, "-X", "importtime", "-c", probe.format(module, HEAVY_MODULES)],
+                                  cwd=here, capture_output=True, text=True, check=True)
+            # Last line of the report: the module itself, cumulative microseconds in column 2
+            line = [l for l in proc.stderr.splitlines() if l.rstrip().endswith(f"| {module}")][-1]
+            seconds = min(seconds, int(line.split("|")[1]) / 1e6)
+            heavy = [m for m in proc.stdout.strip().split(",") if m]
+        results[module] = {"seconds": seconds, "heavy": heavy, "ok": seconds <= budget and not heavy}
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Denoising benchmarks.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("run", help="run the benchmark suite and write the results as JSON")
+    p.add_argument("-o", "--output", default="bench_results.json")
+    p.add_argument("--cases", nargs="+", choices=sorted(CASES), default=None)
+    p.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES),
+                   help=f"image side lengths (full sweep: {' '.join(map(str, ALL_SIZES))})")
+    p.add_argument("--dtypes", nargs="+", choices=DTYPES, default=list(DTYPES))
+    p.add_argument("--threads", type=int, nargs="+", default=[1])
+    p.add_argument("--repeat", type=int, default=3)
+
+    p = sub.add_parser("compare", help="compare a results file against a stored baseline")
+    p.add_argument("baseline")
+    p.add_argument("current")
+    p.add_argument("--threshold", type=float, default=0.10, help="allowed relative slowdown (default: 0.10)")
+
+    p = sub.add_parser("precision", help="float32 vs float64 pipeline: speed and numerical difference")
+    p.add_argument("--size", type=int, default=512)
+    p.add_argument("--bound", type=float, default=1 / 510,
+                   help="largest allowed difference on the [0, 1] scale (default: half an 8-bit step)")
+
+    p = sub.add_parser("engines", help="reference vs in-place Perona-Malik engine")
+    p.add_argument("--size", type=int, default=2048)
+    p.add_argument("--iterations", type=int, default=20)
+    p.add_argument("--dtype", choices=("float32", "float64"), default="float64")
+
+    p = sub.add_parser("batch", help="batched API vs per-frame loop")
+    p.add_argument("--size", type=int, default=256)
+    p.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 16, 64])
+
+    p = sub.add_parser("aos", help="explicit vs AOS Perona-Malik at the same diffusion time")
+    p.add_argument("--size", type=int, default=1024)
+    p.add_argument("--time", type=float, default=5.0, help="diffusion time (default: 5)")
+    p.add_argument("--lambda", dest="lambda_", type=float, default=0.05, help="explicit time step")
+    p.add_argument("--steps", type=int, nargs="+", default=[1, 2, 5, 10])
+
+    p = sub.add_parser("pyramid", help="variational denoiser: full-resolution vs coarse-to-fine")
+    p.add_argument("--size", type=int, default=1024)
+    p.add_argument("--iterations", type=int, nargs="+", default=[50, 200, 400])
+    p.add_argument("--levels", type=int, default=3)
+    p.add_argument("--cycles", type=int, default=0)
+
+    p = sub.add_parser("median", help="scipy vs constant-time histogram median across window sizes")
+    p.add_argument("--size", type=int, default=1024)
+    p.add_argument("--windows", type=int, nargs="+", default=[3, 7, 15, 31])
+    p.add_argument("--workers", type=int, default=1)
+
+    p = sub.add_parser("imports", help="import time of the library modules against a budget")
+    p.add_argument("--budget", type=float, default=IMPORT_BUDGET,
+                   help=f"largest allowed import time in seconds (default: {IMPORT_BUDGET})")
+    p.add_argument("--modules", nargs="+", default=list(LIBRARY_MODULES))
+
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        suite = run_suite(args.cases, args.sizes, args.dtypes, args.threads, args.repeat)
+        with open(args.output, "w") as fh:
+            json.dump(suite, fh, indent=1)
+    elif args.command == "compare":
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+        with open(args.current) as fh:
+            current = json.load(fh)
+        report = compare(baseline, current, args.threshold)
+        for r in report:
+            flag = "REGRESSION" if r["regression"] else ""
+            print(f"{r['case']:>24} {r['size']:>5}^2 {r['dtype']:>7} x{r['threads']:<3} "
+                  f"{r['baseline']:9.4f} -> {r['current']:9.4f} s ({r['ratio']:5.2f}x) {flag}")
+        return 1 if any(r["regression"] for r in report) else 0
+    elif args.command == "precision":
+        r = bench_precision(args.size)
+        print(f"double {r['seconds']['double']:.3f} s, single {r['seconds']['single']:.3f} s")
+        for name, d in r["max_abs_diff"].items():
+            print(f"{name:>14}: max |float32 - float64| = {d:.3g}")
+        return 1 if max(r["max_abs_diff"].values()) > args.bound else 0
+    elif args.command == "engines":
+        results = bench_perona_malik_engines(args.size, args.iterations, np.dtype(args.dtype))
+        for engine, r in results.items():
+            print(f"{engine:>10}: {r['seconds']:.3f} s, {r['mpix_per_s']:.1f} Mpix*iter/s, "
+                  f"peak {r['peak_bytes'] / 2**20:.1f} MiB")
+    elif args.command == "aos":
+        results = bench_aos(args.size, args.time, args.lambda_, args.steps)
+        r = results.pop("explicit")
+        print(f"explicit: {r['steps']:>4} steps {r['seconds']:8.3f} s")
+        for n, r in results.items():
+            print(f"     AOS: {n:>4} steps {r['seconds']:8.3f} s, RMS difference {r['rms_diff']:.2f}")
+    elif args.command == "pyramid":
+        for label, r in bench_pyramid(args.size, args.iterations, levels=args.levels, cycles=args.cycles).items():
+            print(f"{label:>14}: {r['fine_iterations']:>4} fine iterations, {r['seconds']:7.3f} s, NE {r['ne']:.3f}")
+    elif args.command == "median":
+        for w, r in bench_median(args.size, args.windows, args.workers).items():
+            print(f"{w:>3}x{w:<3}: scipy {r['scipy']:8.3f} s, histogram {r['histogram']:8.3f} s")
+    elif args.command == "imports":
+        results = check_imports(args.modules, args.budget)
+        for module, r in results.items():
+            flag = "" if r["ok"] else "OVER BUDGET" if not r["heavy"] else f"IMPORTS {' '.join(r['heavy'])}"
+            print(f"{module:>22}: {r['seconds'] * 1000:7.1f} ms {flag}")
+        return 0 if all(r["ok"] for r in results.values()) else 1
+    else:
+        for (name, B), r in bench_batch(args.size, args.batch_sizes).items():
+            print(f"{name:>20} B={B:<4}: loop {r['loop_fps']:8.1f} fps, batch {r['batch_fps']:8.1f} fps")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+import numpy as np
+
+# Boundary modes, named as in padarray: how an image is extended beyond its border
+#   'replicate'  a a a | a b c d | d d d   (scipy.ndimage 'nearest', numpy.pad 'edge')
+#   'symmetric'  c b a | a b c d | d c b   (scipy.ndimage 'reflect', numpy.pad 'symmetric')
+#   'reflect'    d c b | a b c d | c b a   (scipy.ndimage 'mirror', numpy.pad 'reflect')
+#   'circular'   b c d | a b c d | a b c   (scipy.ndimage 'wrap', numpy.pad 'wrap')
+#   'constant'   v v v | a b c d | v v v   (a number v may be given instead of a name)
+BOUNDARY_MODES = ("replicate", "symmetric", "reflect", "circular", "constant")
+
+# Names of the other libraries accepted as aliases (scipy's 'reflect' is 'symmetric' here)
+_ALIASES = {"nearest": "replicate", "edge": "replicate", "mirror": "reflect", "wrap": "circular"}
+
+_NDIMAGE_MODES = {"replicate": "nearest", "symmetric": "reflect", "reflect": "mirror",
+                  "circular": "wrap", "constant": "constant"}
+_PAD_MODES = {"replicate": "edge", "symmetric": "symmetric", "reflect": "reflect",
+              "circular": "wrap", "constant": "constant"}
+
+
+def boundary_mode(boundary):
+    """
+    Normalizes a boundary specification.
+
+    Parameters:
+    - boundary (str or number): One of BOUNDARY_MODES (or a scipy/numpy alias), or a number
+      for constant extension with that value ('constant' alone extends with 0).
+
+    Returns:
+    - tuple: (name, cval) with name in BOUNDARY_MODES.
+    """
+    if isinstance(boundary, str):
+        name = boundary.lower()
+        name = _ALIASES.get(name, name)
+        if name in BOUNDARY_MODES:
+            return name, 0.0
+    elif isinstance(boundary, (int, float, np.integer, np.floating)) and not isinstance(boundary, bool):
+        return "constant", float(boundary)
+    raise ValueError(f"boundary_mode: Unknown boundary '{boundary}'")
+
+
+def ndimage_mode(boundary):
+    """(mode, cval) arguments of the scipy.ndimage filters for a boundary."""
+    name, cval = boundary_mode(boundary)
+    return _NDIMAGE_MODES[name], cval
+
+
+def cv2_border(boundary):
+    """OpenCV borderType for a boundary ('circular' and non-zero constants are not supported)."""
+    import cv2
+
+    name, cval = boundary_mode(boundary)
+    if name == "circular" or (name == "constant" and cval != 0):
+        raise ValueError(f"cv2_border: OpenCV filters do not support the boundary '{boundary}'")
+    return {"replicate": cv2.BORDER_REPLICATE, "symmetric": cv2.BORDER_REFLECT,
+            "reflect": cv2.BORDER_REFLECT_101, "constant": cv2.BORDER_CONSTANT}[name]
+
+
+def extend(A, pad_width, boundary=0):
+    """
+    Materializes the extension of an array beyond its border (pre-padding).
+
+    The filters and solvers take a boundary argument and treat the border on the fly, so this
+    copy is only needed by callers that want the padded array itself.
+
+    Parameters:
+    - A (numpy.ndarray): Input array.
+    - pad_width: Cells added before and after each axis, as for numpy.pad.
+    - boundary (str or number): Boundary mode (see boundary_mode).
+
+    Returns:
+    - numpy.ndarray: Padded copy of A.
+    """
+    name, cval = boundary_mode(boundary)
+    if name == "constant":
+        return np.pad(A, pad_width, mode="constant", constant_values=cval)
+    return np.pad(A, pad_width, mode=_PAD_MODES[name])
+
+
+def ghost_cells(u, axis, boundary):
+    """
+    The one-cell layers just outside both ends of an axis (ghost cells), without padding u.
+
+    Parameters:
+    - u (numpy.ndarray): Array.
+    - axis (int): Axis whose ends are extended.
+    - boundary (str or number): Boundary mode (see boundary_mode).
+
+    Returns:
+    - tuple: (before, after), each shaped like u with length 1 along axis. They are views of u,
+      except for constant boundaries; 'reflect' requires at least two cells along axis.
+    """
+    name, cval = boundary_mode(boundary)
+    lead = (slice(None),) * axis
+    if name == "constant":
+        shape = u.shape[:axis] + (1,) + u.shape[axis + 1:]
+        ghost = np.full(shape, cval, dtype=u.dtype)
+        return ghost, ghost
+    before, after = {"replicate": (0, -1), "symmetric": (0, -1), "reflect": (1, -2),
+                     "circular": (-1, 0)}[name]
+    return u[lead + (slice(before, before + 1 or None),)], u[lead + (slice(after, after + 1 or None),)]
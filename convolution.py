@@ -0,0 +1,145 @@
+import numpy as np
+
+from tiling import map_tiles
+
+# scipy.ndimage boundary modes and the numpy.pad mode extending an array the same way
+_PAD_MODES = {"nearest": "edge", "reflect": "symmetric", "mirror": "reflect", "wrap": "wrap",
+              "constant": "constant"}
+
+# Non-separable kernels with more taps than this are convolved through the FFT
+FFT_THRESHOLD = 9 * 9
+
+
+def separable_factors(kernel, rtol=1e-10):
+    """
+    Splits a 2-D kernel into a column and a row vector if it has rank 1.
+
+    Parameters:
+    - kernel (numpy.ndarray): 2-D kernel.
+    - rtol (float): Largest second singular value, relative to the first, treated as zero.
+
+    Returns:
+    - tuple or None: (column, row) with kernel == outer(column, row), or None if not separable.
+    """
+    U, s, Vt = np.linalg.svd(kernel)
+    if s[0] == 0 or (len(s) > 1 and s[1] > rtol * s[0]):
+        return None
+    scale = np.sqrt(s[0])
+    return U[:, 0] * scale, Vt[0] * scale
+
+
+def convolve2d(I, kernel, mode="nearest", axes=(0, 1), method="auto", factors=None,
+               fft_threshold=FFT_THRESHOLD, cval=0.0, workers=None):
+    """
+    Convolves the two given axes of an image with a 2-D kernel, choosing the cheapest algorithm.
+
+    Results equal scipy.ndimage.convolve(I, kernel, mode=mode, cval=cval) up to rounding, including the
+    placement of even-sized kernels.
+
+    Parameters:
+    - I (numpy.ndarray): Image; axes other than 'axes' are processed independently.
+    - kernel (numpy.ndarray): 2-D kernel.
+    - mode (str): scipy.ndimage boundary mode ('nearest', 'reflect', 'mirror', 'wrap', 'constant').
+    - axes (tuple): The two image axes spanned by the kernel.
+    - method (str): 'auto', 'box' (running sums, O(1) per pixel), 'separable' (two 1-D passes),
+      'fft' or 'direct'. 'auto' picks box for constant kernels, separable for rank-1 kernels,
+      fft for other kernels with more than fft_threshold taps, and direct otherwise.
+    - factors (tuple, optional): Precomputed (column, row) factors of a separable kernel.
+    - fft_threshold (int): Kernel size (number of taps) above which 'auto' uses the FFT.
+    - cval (float): Value outside the image for mode='constant'.
+    - workers (int, optional): Threads sharing the work; the result is identical to the
+      single-threaded one. The 1-D passes of 'box' and 'separable' split the image into strips
+      of whole lines, 'direct' into strips with a halo of the kernel size, and 'fft' runs the
+      transforms multi-threaded.
+
+    Returns:
+    - numpy.ndarray: Filtered image (floating point).
+    """
+    kernel = np.asarray(kernel)
+    if kernel.ndim != 2:
+        raise ValueError("convolve2d: Kernel must be two-dimensional")
+    if mode not in _PAD_MODES:
+        raise ValueError(f"convolve2d: Unsupported boundary mode '{mode}'")
+    if I.dtype.kind != "f":
+        I = I.astype(np.float64)
+
+    if method == "auto":
+        if np.all(kernel == kernel.flat[0]):
+            method = "box"
+        else:
+            if factors is None:
+                factors = separable_factors(kernel)
+            if factors is not None:
+                method = "separable"
+            elif kernel.size > fft_threshold:
+                method = "fft"
+            else:
+                method = "direct"
+
+    if method == "box":
+        from scipy.ndimage import uniform_filter1d
+
+        # A constant kernel is a box sum; uniform_filter1d is a running mean. Even sizes are
+        # shifted by one, like convolve.
+        J = I
+        for axis, size in zip(axes, kernel.shape):
+            J = _lines(uniform_filter1d, J, axis, axes, workers, size=size, mode=mode, cval=cval,
+                       origin=-1 if size % 2 == 0 else 0)
+        scale = kernel.flat[0] * kernel.size
+        return J if scale == 1 else J * scale
+
+    if method == "separable":
+        from scipy.ndimage import convolve1d
+
+        if factors is None:
+            factors = separable_factors(kernel)
+            if factors is None:
+                raise ValueError("convolve2d: Kernel is not separable")
+        J = _lines(convolve1d, I, axes[0], axes, workers, weights=factors[0], mode=mode, cval=cval)
+        # Beyond the border the first pass sees only cval, so its output there is cval times the
+        # sum of the column factor: that, not cval, is what the second pass must extend with
+        return _lines(convolve1d, J, axes[1], axes, workers, weights=factors[1], mode=mode,
+                      cval=cval * float(np.sum(factors[0])))
+
+    shape = [1] * I.ndim
+    shape[axes[0]], shape[axes[1]] = kernel.shape
+    kernel_nd = kernel.reshape(shape)
+
+    if method == "fft":
+        from scipy import fft as sp_fft
+        from scipy.signal import fftconvolve
+
+        pad = [(0, 0)] * I.ndim
+        for axis, size in zip(axes, kernel.shape):
+            pad[axis] = (size - 1 - size // 2, size // 2)
+        if mode == "constant":
+            P = np.pad(I, pad, mode="constant", constant_values=cval)
+        else:
+            P = np.pad(I, pad, mode=_PAD_MODES[mode])
+        with sp_fft.set_workers(workers or 1):
+            return fftconvolve(P, kernel_nd, mode="valid", axes=axes)
+
+    if method == "direct":
+        from scipy.ndimage import convolve
+
+        if workers is None or workers <= 1:
+            return convolve(I, kernel_nd, mode=mode, cval=cval)
+        strip = -(-I.shape[axes[0]] // workers)
+        return map_tiles(lambda B: convolve(B, kernel_nd, mode=mode, cval=cval), I, kernel.shape,
+                         (strip, None), axes, periodic=mode == "wrap", workers=workers)
+
+    raise ValueError(f"convolve2d: Unknown method '{method}'")
+
+
+def _lines(filter1d, I, axis, axes, workers, **kwargs):
+    """
+    filter1d(I, axis=axis, **kwargs), with the lines along 'axis' shared between threads in
+    strips across the other axis of 'axes'. Every line is filtered whole, so the running sums
+    of uniform_filter1d, which depend on where a line starts, are unchanged.
+    """
+    if workers is None or workers <= 1:
+        return filter1d(I, axis=axis, **kwargs)
+    first = axis % I.ndim == axes[0] % I.ndim
+    strip = -(-I.shape[axes[1] if first else axes[0]] // workers)
+    return map_tiles(lambda B: filter1d(B, axis=axis, **kwargs), I, 0,
+                     (None, strip) if first else (strip, None), axes, workers=workers)
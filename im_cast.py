@@ -1,6 +1,6 @@
 import numpy as np
-import cv2
-import matplotlib.pyplot as plt
+
+
 def imcast(img, outcls, indexed=False):
     """
     Convert an image to a specified data type with appropriate scaling.
@@ -37,7 +37,7 @@ def imcast(img, outcls, indexed=False):
     incls = str(img.dtype)
 
     # If already in the correct type, return as is
-    if incls == outcls:
+    if img.dtype == dtype_map[outcls]:
         return img
 
     # Indexed image conversion
@@ -60,18 +60,27 @@ def imcast(img, outcls, indexed=False):
                 "uint16": 65535,
                 "int16": 32767
             }[outcls]
-            img = np.clip(img * scale_factor, 0, scale_factor)  # Scale and clip
+            img = img * scale_factor
+            np.clip(img, 0, scale_factor, out=img)  # Scale and clip
+            return img.astype(dtype_map[outcls])
+        elif outcls in ["double", "single"]:  # Change of precision, same [0, 1] range
             return img.astype(dtype_map[outcls])
+        elif outcls == "logical":
+            return img > 0
 
     elif incls == "uint8":  # Integer to floating point or logical
         if outcls in ["double", "single"]:
-            return img.astype(dtype_map[outcls]) / 255.0
+            img = img.astype(dtype_map[outcls])
+            img /= 255.0
+            return img
         elif outcls == "logical":
             return img > 0
 
     elif incls == "uint16":
         if outcls in ["double", "single"]:
-            return img.astype(dtype_map[outcls]) / 65535.0
+            img = img.astype(dtype_map[outcls])
+            img /= 65535.0
+            return img
         elif outcls == "uint8":
             return (img / 257).astype(np.uint8)  # 65535/255 = 257
         elif outcls == "logical":
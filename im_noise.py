@@ -1,23 +1,85 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 
-def im_noise(A, stype, a=None, b=None):
+# Elements per independently seeded block of the parallel generator. The noise drawn for a
+# seed depends on this value and on the image shape, never on the number of threads.
+CHUNK_ELEMENTS = 2 ** 18
+
+
+def _seed_sequence(seed):
+    """SeedSequence for an int, SeedSequence or Generator seed (None draws from np.random)."""
+    if isinstance(seed, np.random.SeedSequence):  # Fresh copy: spawning would change the caller's
+        return np.random.SeedSequence(seed.entropy, spawn_key=seed.spawn_key, pool_size=seed.pool_size)
+    if isinstance(seed, np.random.Generator):
+        return np.random.SeedSequence(seed.integers(0, 2 ** 63, size=4))  # Advances the generator
+    if seed is None:
+        return np.random.SeedSequence(np.random.randint(0, 2 ** 31, size=4))
+    return np.random.SeedSequence(seed)
+
+
+def _noise_block(src, dst, stype, a, b, rng):
+    """Adds noise to a block of rows in float32 and writes the result to dst (output dtype)."""
+    if stype == "poisson":
+        dst[...] = rng.poisson(src)
+        return
+    x = src.astype(np.float32)
+    if stype == "gaussian":
+        noise = rng.standard_normal(x.shape, dtype=np.float32)
+        noise *= np.sqrt(b)
+        noise += a
+        x *= 1 / 255.0
+        x += noise
+        np.clip(x, 0, 1, out=x)
+        x *= 255
+    elif stype == "salt & pepper":
+        u = rng.random(x.shape, dtype=np.float32)
+        x[u < (a / 2)] = 0
+        x[u > 1 - (a / 2)] = 255
+    else:  # Speckle
+        noise = rng.standard_normal(x.shape, dtype=np.float32)
+        noise *= np.sqrt(a)
+        noise += 1
+        x *= 1 / 255.0
+        x *= noise
+        np.clip(x, 0, 1, out=x)
+        x *= 255
+    dst[...] = x
+
+
+def im_noise(A, stype, a=None, b=None, seed=None, n_variants=None, workers=None):
     """
     Adds different types of noise to an image.
 
+    With the defaults the noise is drawn from the global NumPy random state, as it always was.
+    Passing a seed, n_variants or workers switches to the parallel generator: the image is cut
+    into blocks of rows, each block draws float32 noise from its own stream spawned from one
+    SeedSequence, and the blocks are filled by a thread pool directly in the output dtype. The
+    result only depends on the seed, never on the number of threads.
+
     Parameters:
     - A (numpy.ndarray): Input image.
     - stype (str): Type of noise ('poisson', 'gaussian', 'salt & pepper', 'speckle').
     - a (float, optional): First parameter (varies by noise type).
     - b (float, optional): Second parameter (varies by noise type).
+    - seed (int, numpy.random.SeedSequence or numpy.random.Generator, optional): Source of the
+      noise streams; the same int or SeedSequence always gives the same noise, a Generator is
+      advanced by every call.
+    - n_variants (int, optional): Return a stack of n_variants independently noised copies of A.
+    - workers (int, optional): Threads filling the blocks (default: os.cpu_count()).
 
     Returns:
-    - numpy.ndarray: Noisy image.
+    - numpy.ndarray: Noisy image, or an n_variants x A.shape stack.
     """
     if not isinstance(A, np.ndarray):
         raise TypeError("im_noise: First argument must be an image (numpy array).")
     if not isinstance(stype, str):
         raise TypeError("im_noise: Second argument must be a string representing noise type.")
 
+    if seed is not None or n_variants is not None or workers is not None:
+        return _im_noise_parallel(A, stype, a, b, seed, n_variants, workers)
+
     # Store original class
     in_class = A.dtype
 
@@ -52,6 +114,43 @@ def im_noise(A, stype, a=None, b=None):
     return A.astype(in_class)  # Convert back to original type
 
 
+def _im_noise_parallel(A, stype, a, b, seed, n_variants, workers):
+    """im_noise with independent, SeedSequence-spawned float32 streams per block of rows."""
+    stype = stype.lower()
+    if stype == "salt and pepper":
+        stype = "salt & pepper"
+    if stype == "gaussian":
+        if a is None: a = 0.0  # Mean
+        if b is None: b = 0.01  # Variance
+    elif stype == "salt & pepper":
+        if a is None: a = 0.05  # Default noise density
+    elif stype == "speckle":
+        if a is None: a = 0.04  # Default variance
+    elif stype != "poisson":
+        raise ValueError(f"im_noise: Unknown noise type '{stype}'.")
+    if n_variants is not None and n_variants < 1:
+        raise ValueError("im_noise: n_variants must be a positive integer.")
+
+    variants = 1 if n_variants is None else n_variants
+    out = np.empty((variants,) + A.shape, dtype=A.dtype)
+    rows = max(1, CHUNK_ELEMENTS // max(1, A[0].size))
+    blocks = [(v, r0, min(r0 + rows, len(A))) for v in range(variants) for r0 in range(0, len(A), rows)]
+    streams = _seed_sequence(seed).spawn(len(blocks))
+
+    def fill(i):
+        v, r0, r1 = blocks[i]
+        _noise_block(A[r0:r1], out[v, r0:r1], stype, a, b, np.random.default_rng(streams[i]))
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(blocks) == 1:
+        for i in range(len(blocks)):
+            fill(i)
+    else:
+        with ThreadPoolExecutor(workers) as pool:  # Generator methods release the GIL
+            list(pool.map(fill, range(len(blocks))))
+    return out if n_variants is not None else out[0]
+
+
                         ###### TO UNDERSTAND HOW THIS CODE WILL WORK ########
 
 
@@ -1,51 +1,131 @@
 import numpy as np
-import cv2
-from scipy.ndimage import convolve, gaussian_filter, median_filter
 
+from boundary import cv2_border, ndimage_mode
+from convolution import convolve2d
+from kernel import filter_bank, fspecial
+from median_filter import HISTOGRAM_THRESHOLD, median_filter as histogram_median
+from tiling import map_tiles
 
-def imsmooth(I, name="gaussian", *args):
+# Smallest tile side of the tiled filters; tiles grow with the filter radius (8 radii) so that
+# the recomputed halo stays a small fraction of the work
+TILE_SIZE = 256
+
+
+def imsmooth(I, name="gaussian", *args, batch=False, dtype=np.float64, boundary="replicate",
+             channel_axis=None, workers=None, tile_shape=None):
+    """
+    Smooths an image with the named filter ('gaussian', 'average', 'disk', 'median', 'bilateral').
+
+    The filters run in dtype (np.float64 by default, np.float32 for single-precision pipelines);
+    input already in that dtype is not copied. 'bilateral' always returns float32. 'median' on
+    uint8 input with a window of HISTOGRAM_THRESHOLD pixels or more uses the constant-time
+    histogram filter of median_filter.py, which gives the same result.
+
+    With batch=True the first axis of I indexes frames (B x H x W [x C]): the filters never mix
+    frames, and the result equals calling imsmooth on each frame and stacking the outputs.
+
+    boundary (see boundary.py) sets how every filter extends the image beyond its border,
+    inside the filter: 'replicate' (default), 'symmetric', 'reflect', 'circular' or a constant
+    value, so the input does not need to be padded first. 'bilateral' does not support
+    'circular' or non-zero constants.
+
+    channel_axis marks the channel axis of a colour/multichannel image (interleaved, e.g. -1,
+    or planar, e.g. 0): the filters then run on the two other axes only. 'bilateral' weighs
+    the colour difference of all channels jointly (OpenCV), the other filters are per channel.
+
+    workers runs the filter on a thread pool, with the same result as the single-threaded call.
+    'gaussian' and 'median' split the image into tiles overlapping by the filter radius
+    (smoothing_radius), written into one output; tile_shape sets the tile size (default:
+    TILE_SIZE or 8 radii, whichever is larger). 'average' and 'disk' share the
+    passes of convolve2d between the threads. 'bilateral' runs whole on OpenCV's own threads:
+    its range table depends on the value range of the whole image.
+    """
     if I is None:
         raise ValueError("imsmooth: First argument must be an image")
 
-    I = np.array(I, dtype=np.float64)
+    source = np.asarray(I)
+    if source.dtype.kind in "biu":
+        I = source  # Converted on the fly by the scipy filters, which accept an output dtype
+    else:
+        I = source.astype(dtype, copy=False)
+    if batch and I.ndim < 3:
+        raise ValueError("imsmooth: A batch must have a leading frame axis (B x H x W [x C])")
+    lead = (1,) if batch else ()  # Filter extent along the frame axis
+    spatial = (1, 2) if batch else (0, 1)
+    if channel_axis is not None:
+        if not -I.ndim <= channel_axis < I.ndim:
+            raise ValueError(f"imsmooth: channel_axis {channel_axis} is out of range")
+        channel_axis %= I.ndim
+        spatial = tuple(a for a in range(len(lead), I.ndim) if a != channel_axis)[:2]
 
+    mode, cval = ndimage_mode(boundary)
     name = name.lower()
     J = None
 
+    def tiled():
+        # Only 'gaussian' and 'median', once their arguments are checked. OpenCV's float bilateral
+        # filter scales its range table by the value range of the image it is given, so tiles
+        # would weigh differently: that call stays whole (OpenCV spreads it over its own threads)
+        radius = smoothing_radius(name, *args)
+        return map_tiles(lambda T: imsmooth(T, name, *args, batch=batch, dtype=dtype, boundary=boundary,
+                                            channel_axis=channel_axis),
+                         source, radius, tile_shape or max(TILE_SIZE, 8 * radius), spatial,
+                         periodic=mode == "wrap", workers=workers)
+
     if name == "gaussian":
+        from scipy.ndimage import gaussian_filter
+
         s = 0.5 if len(args) == 0 else args[0]
         if not isinstance(s, (int, float)) or s <= 0:
             raise ValueError("imsmooth: Third argument must be a positive scalar for Gaussian smoothing")
-        J = gaussian_filter(I, sigma=s, mode='nearest')
+        if workers is not None:
+            return tiled()
+        sigma = (0,) * len(lead) + (s,) * (I.ndim - len(lead))
+        if channel_axis is not None:
+            sigma = tuple(s if a in spatial else 0 for a in range(I.ndim))
+        J = gaussian_filter(I, sigma=sigma, output=dtype, mode=mode, cval=cval)
 
     elif name == "average":
         s = (3, 3) if len(args) == 0 else args[0]
-        if isinstance(s, int):
+        if isinstance(s, int) and s > 0:
             s = (s, s)
         elif isinstance(s, (list, tuple)) and len(s) == 2 and all(isinstance(v, int) and v > 0 for v in s):
             pass
         else:
             raise ValueError("imsmooth: Third argument must be a positive scalar or two-vector for averaging")
-        kernel = np.ones(s) / np.prod(s)
-        J = convolve(I, kernel, mode='nearest')
+        kernel, factors = filter_bank("average", s)
+        I = I.astype(dtype, copy=False)
+        # Running sums, O(1) per pixel
+        J = convolve2d(I, kernel, mode=mode, axes=spatial, factors=factors, cval=cval, workers=workers)
 
     elif name == "disk":
         r = 5 if len(args) == 0 else args[0]
         if not isinstance(r, (int, float)) or r <= 0:
             raise ValueError("imsmooth: Third argument must be a positive scalar for disk averaging")
-        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (r, r))
-        kernel = kernel / kernel.sum()
-        J = convolve(I, kernel, mode='nearest')
+        kernel = fspecial("ellipse", r)
+        I = I.astype(dtype, copy=False)
+        J = convolve2d(I, kernel, mode=mode, axes=spatial, cval=cval, workers=workers)  # FFT for large radii
 
     elif name == "median":
         s = (3, 3) if len(args) == 0 else args[0]
-        if isinstance(s, int):
+        if isinstance(s, int) and s > 0:
             s = (s, s)
         elif isinstance(s, (list, tuple)) and len(s) == 2 and all(isinstance(v, int) and v > 0 for v in s):
             pass
         else:
             raise ValueError("imsmooth: Third argument must be a positive scalar or two-vector for median filtering")
-        J = median_filter(I, size=s, mode='nearest')
+        if workers is not None:
+            return tiled()
+        if (source.dtype == np.uint8 and s[0] * s[1] >= HISTOGRAM_THRESHOLD
+                and (mode != "constant" or cval == np.uint8(cval))):
+            # Same result, O(1) in window size
+            J = histogram_median(source, s, axes=spatial, boundary=boundary).astype(dtype)
+        else:
+            from scipy.ndimage import median_filter
+
+            extent = [1] * I.ndim  # Window extent of each axis
+            extent[spatial[0]], extent[spatial[1]] = s
+            J = median_filter(I, size=extent, output=dtype, mode=mode, cval=cval)
 
     elif name == "bilateral":
         sigma_d = 2 if len(args) < 1 else args[0]
@@ -55,9 +135,45 @@ def imsmooth(I, name="gaussian", *args):
         if not isinstance(sigma_r, (int, float)) or sigma_r <= 0:
             raise ValueError("imsmooth: Spread of similarity function must be a positive scalar")
 
-        J = cv2.bilateralFilter(I.astype(np.float32), d=-1, sigmaColor=sigma_r * 255, sigmaSpace=sigma_d)
+        import cv2
+
+        border = cv2_border(boundary)
+        frames = I.astype(np.float32, copy=False)
+        if channel_axis is not None and channel_axis != I.ndim - 1:
+            frames = np.moveaxis(frames, channel_axis, -1)  # OpenCV takes interleaved channels
+        if not batch:
+            J = cv2.bilateralFilter(np.ascontiguousarray(frames), d=-1, sigmaColor=sigma_r * 255,
+                                    sigmaSpace=sigma_d, borderType=border)
+        else:
+            J = np.empty(frames.shape, dtype=np.float32)
+            for b in range(frames.shape[0]):
+                J[b] = cv2.bilateralFilter(np.ascontiguousarray(frames[b]), d=-1, sigmaColor=sigma_r * 255,
+                                           sigmaSpace=sigma_d, borderType=border)
+        if channel_axis is not None and channel_axis != I.ndim - 1:
+            J = np.moveaxis(J, -1, channel_axis)
 
     else:
         raise ValueError(f"imsmooth: Unsupported smoothing type '{name}'")
 
     return J
+
+
+def smoothing_radius(name="gaussian", *args):
+    """
+    Number of neighbouring rows/columns on each side that imsmooth(I, name, *args) reads to
+    compute one output pixel, i.e. the overlap needed to process an image in pieces.
+    """
+    name = name.lower()
+    if name == "gaussian":
+        s = 0.5 if len(args) == 0 else args[0]
+        return int(4.0 * s + 0.5)  # gaussian_filter truncates at 4 sigma
+    elif name in ("average", "median"):
+        s = (3, 3) if len(args) == 0 else args[0]
+        return max(s) // 2 if isinstance(s, (list, tuple)) else s // 2
+    elif name == "disk":
+        r = 5 if len(args) == 0 else args[0]
+        return int(r) // 2
+    elif name == "bilateral":
+        sigma_d = 2 if len(args) < 1 else args[0]
+        return int(np.ceil(1.5 * sigma_d))  # cv2.bilateralFilter radius for d <= 0
+    raise ValueError(f"smoothing_radius: Unsupported smoothing type '{name}'")
@@ -0,0 +1,154 @@
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# Callbacks receiving every event dict; instrumentation is disabled while this list is empty
+_listeners = []
+
+# Running peak of traced memory of each open stage, innermost last. tracemalloc has one global
+# peak, which every stage resets on entry, so a stage first folds the peak reached so far into
+# its parent's entry, and on exit folds its own peak into it
+_peaks = []
+
+
+def add_listener(callback):
+    """
+    Registers a callback receiving every event as a dict with at least 'event' and 'time'.
+
+    Event types:
+    - 'stage': 'stage', 'seconds' and, with memory tracking on, 'bytes_allocated' (peak traced
+      memory above that at entry, including nested stages) and 'net_bytes' (change at exit).
+    - 'iteration': 'solver', 'iteration' and 'seconds' (one per PDE solver iteration).
+    """
+    _listeners.append(callback)
+    return callback
+
+
+def remove_listener(callback):
+    """Unregisters a callback added with add_listener."""
+    _listeners.remove(callback)
+
+
+def enabled():
+    """True if at least one listener is registered; hot loops test this once before iterating."""
+    return bool(_listeners)
+
+
+def enable_memory_tracking(enable=True):
+    """
+    Starts (or stops) tracemalloc so that stage events report allocated bytes. NumPy reports its
+    buffers to tracemalloc, but tracing slows every allocation, so it is off by default.
+    """
+    if enable and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    elif not enable and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def emit(event, **fields):
+    """Sends an event to every listener (no-op when none is registered)."""
+    if not _listeners:
+        return
+    record = {"event": event, "time": time.time(), **fields}
+    for callback in list(_listeners):
+        callback(record)
+
+
+@contextmanager
+def stage(name, **fields):
+    """
+    Context manager timing a pipeline stage and emitting a 'stage' event when it exits.
+    Extra keyword arguments are copied into the event.
+    """
+    if not _listeners:
+        yield
+        return
+
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        start_bytes, peak = tracemalloc.get_traced_memory()
+        if _peaks:
+            _peaks[-1] = max(_peaks[-1], peak)
+        tracemalloc.reset_peak()
+        _peaks.append(start_bytes)
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - t0
+        if tracing:
+            end_bytes, peak = tracemalloc.get_traced_memory()
+            peak = max(peak, _peaks.pop())
+            if _peaks:
+                _peaks[-1] = max(_peaks[-1], peak)
+
+    if tracing:
+        fields = {**fields, "bytes_allocated": max(peak - start_bytes, 0), "net_bytes": end_bytes - start_bytes}
+    emit("stage", stage=name, seconds=seconds, **fields)
+
+
+class JsonLinesSink:
+    """
+    Listener writing every event as one JSON line.
+
+    Parameters:
+    - target (str or file): Path (opened in append mode, so several processes can share it)
+      or an open text file.
+    """
+
+    def __init__(self, target):
+        self._own = isinstance(target, str)
+        self._fh = open(target, "a", buffering=1) if self._own else target
+
+    def __call__(self, event):
+        self._fh.write(json.dumps(event) + "\n")
+
+    def close(self):
+        if self._own:
+            self._fh.close()
+
+
+class PrometheusCollector:
+    """
+    Listener aggregating events into counters, exported in the Prometheus text format.
+
+    Metrics:
+    - denoise_stage_seconds_total / denoise_stage_calls_total / denoise_stage_bytes_allocated_total
+      labelled by stage.
+    - denoise_solver_iteration_seconds_total / denoise_solver_iterations_total labelled by solver.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.solvers = {}
+
+    def __call__(self, event):
+        if event["event"] == "stage":
+            s = self.stages.setdefault(event["stage"], [0.0, 0, 0])
+            s[0] += event["seconds"]
+            s[1] += 1
+            s[2] += event.get("bytes_allocated", 0)
+        elif event["event"] == "iteration":
+            s = self.solvers.setdefault(event["solver"], [0.0, 0])
+            s[0] += event["seconds"]
+            s[1] += 1
+
+    def render(self):
+        """Returns the current counters as Prometheus exposition text."""
+        lines = []
+        metrics = (
+            ("denoise_stage_seconds_total", "Wall time spent in each pipeline stage.", self.stages, 0, "stage"),
+            ("denoise_stage_calls_total", "Number of times each pipeline stage ran.", self.stages, 1, "stage"),
+            ("denoise_stage_bytes_allocated_total", "Bytes allocated in each pipeline stage.", self.stages, 2,
+             "stage"),
+            ("denoise_solver_iteration_seconds_total", "Wall time spent in PDE solver iterations.", self.solvers,
+             0, "solver"),
+            ("denoise_solver_iterations_total", "Number of PDE solver iterations.", self.solvers, 1, "solver"),
+        )
+        for metric, help_text, table, index, label in metrics:
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} counter")
+            for key, values in sorted(table.items()):
+                lines.append(f'{metric}{{{label}="{key}"}} {values[index]}')
+        return "\n".join(lines) + "\n"
@@ -1,28 +1,80 @@
+from functools import lru_cache
+
 import numpy as np
-import cv2
 
-def fspecial(filter_type, arg1=None, arg2=None):
+# Number of distinct kernels (type, arguments, dtype) the filter bank keeps
+FILTER_BANK_SIZE = 256
+
+
+def fspecial(filter_type, arg1=None, arg2=None, dtype=None):
     """
     Creates predefined 2D filters similar to MATLAB's fspecial.
 
+    Kernels come from a bounded, memoized filter bank (see filter_bank): repeated requests
+    return the same read-only array, without rebuilding or copying it. Copy it to modify it.
+
     Parameters:
-    - filter_type (str): Type of filter ('average', 'disk', 'gaussian', 'laplacian', 'log', 'motion', 'prewitt', 'sobel', 'kirsch', 'unsharp').
+    - filter_type (str): Type of filter ('average', 'disk', 'gaussian', 'laplacian', 'log', 'motion', 'prewitt', 'sobel', 'kirsch', 'unsharp', 'ellipse').
     - arg1 (various): Size, radius, sigma, or other parameter depending on the filter type.
     - arg2 (various, optional): Additional parameter depending on the filter type.
+    - dtype (optional): Data type of the kernel (default: float64, integers for the gradient kernels).
+
+    Returns:
+    - numpy.ndarray: The generated filter (read-only).
+    """
+    return filter_bank(filter_type, arg1, arg2, dtype)[0]
+
+
+def filter_bank(filter_type, arg1=None, arg2=None, dtype=None):
+    """
+    Kernel of fspecial and, for separable types ('average', 'gaussian', 'motion', 'prewitt',
+    'sobel'), its 1-D factors, which convolve2d takes directly (factors=...).
+
+    Entries are keyed by (type, arguments, dtype) and the least recently used are dropped
+    beyond FILTER_BANK_SIZE; filter_bank.cache_info() reports hits and misses.
 
     Returns:
-    - numpy.ndarray: The generated filter.
+    - tuple: (kernel, factors), with factors (column, row) such that kernel == outer(column, row),
+      or None. All arrays are read-only and shared between callers.
     """
+    return _bank_entry(filter_type.lower(), _hashable(arg1), _hashable(arg2),
+                       None if dtype is None else np.dtype(dtype))
 
-    filter_type = filter_type.lower()
 
+def _hashable(arg):
+    # Lists and arrays (of any dimension) as nested tuples, usable as lru_cache keys
+    if isinstance(arg, np.ndarray):
+        arg = arg.tolist()
+    if isinstance(arg, (list, tuple)):
+        return tuple(_hashable(v) for v in arg)
+    return arg
+
+
+@lru_cache(maxsize=FILTER_BANK_SIZE)
+def _bank_entry(filter_type, arg1, arg2, dtype):
+    f, factors = _build(filter_type, arg1, arg2)
+    f = np.asarray(f) if dtype is None else np.asarray(f, dtype=dtype)
+    f.setflags(write=False)
+    if factors is not None:
+        factors = tuple(np.asarray(v) if dtype is None else np.asarray(v, dtype=dtype) for v in factors)
+        for v in factors:
+            v.setflags(write=False)
+    return f, factors
+
+
+filter_bank.cache_info = _bank_entry.cache_info
+filter_bank.cache_clear = _bank_entry.cache_clear
+
+
+def _build(filter_type, arg1, arg2):
+    """Builds a kernel of fspecial and its 1-D factors (None if not separable)."""
     # Average Filter
     if filter_type == "average":
         if arg1 is None:
             size = (3, 3)  # Default size
         else:
             size = tuple(arg1) if isinstance(arg1, (list, tuple)) else (arg1, arg1)
-        return np.ones(size) / np.prod(size)
+        return np.ones(size) / np.prod(size), (np.ones(size[0]) / size[0], np.ones(size[1]) / size[1])
 
     # Disk Filter
     elif filter_type == "disk":
@@ -34,7 +86,7 @@ def fspecial(filter_type, arg1=None, arg2=None):
         mask = x**2 + y**2 <= r**2
         kernel = np.zeros((2*r+1, 2*r+1))
         kernel[mask] = 1
-        return kernel / np.sum(kernel)
+        return kernel / np.sum(kernel), None
 
     # Gaussian Filter
     elif filter_type == "gaussian":
@@ -43,7 +95,10 @@ def fspecial(filter_type, arg1=None, arg2=None):
         else:
             size = tuple(arg1) if isinstance(arg1, (list, tuple)) else (arg1, arg1)
         sigma = arg2 if arg2 else 0.5
-        return cv2.getGaussianKernel(size[0], sigma) @ cv2.getGaussianKernel(size[1], sigma).T
+        import cv2
+
+        column, row = cv2.getGaussianKernel(size[0], sigma), cv2.getGaussianKernel(size[1], sigma)
+        return column @ row.T, (column[:, 0], row[:, 0])
 
     # Laplacian Filter
     elif filter_type == "laplacian":
@@ -51,7 +106,7 @@ def fspecial(filter_type, arg1=None, arg2=None):
         f = np.array([[alpha/4, (1-alpha)/4, alpha/4],
                       [(1-alpha)/4, -1, (1-alpha)/4],
                       [alpha/4, (1-alpha)/4, alpha/4]])
-        return f
+        return f, None
 
     # Laplacian of Gaussian (LoG) Filter
     elif filter_type == "log":
@@ -62,7 +117,7 @@ def fspecial(filter_type, arg1=None, arg2=None):
                            np.arange(-hsize[1]//2, hsize[1]//2+1))
         gauss = np.exp(-(x**2 + y**2) / (2*sigma**2))
         f = ((x**2 + y**2 - 2*sigma**2) * gauss) / (2*np.pi*sigma**6 * np.sum(gauss))
-        return f
+        return f, None
 
     # Motion Blur Filter
     elif filter_type == "motion":
@@ -71,19 +126,21 @@ def fspecial(filter_type, arg1=None, arg2=None):
         f = np.zeros((length, length))
         f[length//2, :] = 1
         f = f / np.sum(f)
-        return f
+        column = np.zeros(length)
+        column[length//2] = 1
+        return f, (column, np.ones(length) / length)
 
     # Prewitt Filter
     elif filter_type == "prewitt":
-        return np.array([[1, 1, 1], [0, 0, 0], [-1, -1, -1]])
+        return np.array([[1, 1, 1], [0, 0, 0], [-1, -1, -1]]), (np.array([1, 0, -1]), np.array([1, 1, 1]))
 
     # Sobel Filter
     elif filter_type == "sobel":
-        return np.array([[1, 2, 1], [0, 0, 0], [-1, -2, -1]])
+        return np.array([[1, 2, 1], [0, 0, 0], [-1, -2, -1]]), (np.array([1, 0, -1]), np.array([1, 2, 1]))
 
     # Kirsch Filter
     elif filter_type == "kirsch":
-        return np.array([[3, 3, 3], [3, 0, -3], [-5, -5, -5]])
+        return np.array([[3, 3, 3], [3, 0, -3], [-5, -5, -5]]), None
 
     # Unsharp Masking Filter
     elif filter_type == "unsharp":
@@ -91,9 +148,15 @@ def fspecial(filter_type, arg1=None, arg2=None):
         f = (1/(alpha+1)) * np.array([[-alpha, -1, -alpha],
                                       [-1, alpha+5, -1],
                                       [-alpha, -1, -alpha]])
-        return f
+        return f, None
 
-    else:
-        raise ValueError(f"fspecial: Filter type '{filter_type}' is not supported.")
+    # Elliptical Mask (the averaging window of imsmooth 'disk', cv2.MORPH_ELLIPSE)
+    elif filter_type == "ellipse":
+        import cv2
 
+        size = (5, 5) if arg1 is None else (tuple(arg1) if isinstance(arg1, (list, tuple)) else (arg1, arg1))
+        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (int(size[1]), int(size[0])))
+        return kernel / kernel.sum(), None
 
+    else:
+        raise ValueError(f"fspecial: Filter type '{filter_type}' is not supported.")
@@ -0,0 +1,142 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from boundary import boundary_mode, extend
+
+# Window area from which imsmooth's 'auto' median switches to the histogram filter
+HISTOGRAM_THRESHOLD = 9 * 9
+
+
+def _window_counts(mask, size, col, out):
+    """
+    Number of True values of mask in every size[0] x size[1] window (valid part only), from
+    cumulative sums along both axes. col and out are preallocated count buffers; the counts are
+    unsigned and may wrap around in the cumulative sums, but differences of wrapped sums are
+    exact as long as a window holds fewer values than the dtype can represent.
+    """
+    s0, s1 = size
+    rows = mask.shape[0] - s0 + 1
+    np.cumsum(mask, axis=0, dtype=col.dtype, out=col[1:])
+    np.subtract(col[s0:], col[:rows], out=out[:, 1:])  # Column sums over s0 rows
+    np.cumsum(out[:, 1:], axis=1, out=out[:, 1:])
+    return out[:, s1:] - out[:, :-s1]
+
+
+def _median_strip(P, size, levels):
+    """
+    Median of every window of the padded strip P, holding level indices in [0, levels).
+
+    Threshold decomposition: the median is the number of levels v whose window count
+    #(P <= v) does not exceed the median rank, so each level costs one O(1)-per-pixel box
+    count whatever the window size. A coarse pass over every step-th level first brackets the
+    medians of the strip, and the fine pass only visits the levels inside that bracket.
+    """
+    s0, s1 = size
+    n = s0 * s1
+    rank = n // 2  # scipy.ndimage.median_filter takes the upper median for even windows
+    count_dtype = np.uint16 if n < 2 ** 16 else np.uint32
+    out_shape = (P.shape[0] - s0 + 1, P.shape[1] - s1 + 1) + P.shape[2:]
+
+    col = np.zeros((P.shape[0] + 1,) + P.shape[1:], dtype=count_dtype)
+    acc = np.zeros((out_shape[0], P.shape[1] + 1) + P.shape[2:], dtype=count_dtype)
+    mask = np.empty(P.shape, dtype=bool)
+
+    def passed(v):  # Windows whose median is above level v
+        np.less_equal(P, v, out=mask)
+        return _window_counts(mask, size, col, acc) <= rank
+
+    # Coarse pass: the medians lie in [lo, hi]
+    lo, hi = int(P.min()), int(P.max())
+    step = max(int(np.sqrt(hi - lo + 1)), 1)
+    for v in range(lo + step - 1, hi, step):
+        below = passed(v)
+        if below.all():
+            lo = v + 1
+        elif not below.any():
+            hi = v
+            break
+
+    J = np.full(out_shape, lo, dtype=np.uint16 if levels <= 2 ** 16 else np.uint32)
+    for v in range(lo, min(hi, levels - 1)):
+        below = passed(v)
+        if not below.any():
+            break
+        J += below
+    return J
+
+
+def median_filter(I, size=(3, 3), axes=(0, 1), workers=None, strip_rows=64, boundary="replicate"):
+    """
+    Constant-time median filter for 8- and 16-bit images.
+
+    The result equals scipy.ndimage.median_filter(I, size) with the same boundary on the two
+    given axes, but the cost per pixel does not depend on the window size: it is one box count per
+    grey level (threshold decomposition of the windowed histogram, in the spirit of
+    Perreault and Hebert). uint8 images have at most 256 levels; other integer images are first
+    mapped to the ranks of their distinct values, so the cost grows with the number of levels
+    actually present (up to 65536 for uint16).
+
+    Parameters:
+    - I (numpy.ndarray): Integer image; axes other than 'axes' are filtered independently.
+    - size (int or tuple): Window size (rows, columns).
+    - axes (tuple): The two image axes spanned by the window.
+    - workers (int, optional): Threads processing row strips in parallel (default: 1).
+    - strip_rows (int): Output rows per strip; bounds the size of the work buffers.
+    - boundary (str or number): Boundary mode (see boundary.py); a constant must be a value of
+      the image dtype.
+
+    Returns:
+    - numpy.ndarray: Filtered image with the dtype of I.
+    """
+    I = np.asarray(I)
+    if I.dtype.kind not in "ui":
+        raise ValueError(f"median_filter: Integer image required, got {I.dtype}")
+    if isinstance(size, int):
+        size = (size, size)
+    if len(size) != 2 or any(not isinstance(s, (int, np.integer)) or s <= 0 for s in size):
+        raise ValueError("median_filter: size must be a positive scalar or two-vector")
+    if strip_rows <= 0:
+        raise ValueError("median_filter: strip_rows must be positive")
+
+    A = np.moveaxis(I, axes, (0, 1))
+    if I.dtype == np.uint8:
+        values, levels = None, 256
+    else:
+        values, A = np.unique(A, return_inverse=True)
+        A = A.reshape(np.moveaxis(I, axes, (0, 1)).shape)
+        levels = len(values)
+
+    name, cval = boundary_mode(boundary)
+    if name == "constant":
+        fill = I.dtype.type(cval)
+        if fill != cval:
+            raise ValueError(f"median_filter: Constant {cval} is not a {I.dtype} value")
+        if values is not None:  # Give the constant a rank of its own
+            merged = np.union1d(values, [fill])
+            A = np.searchsorted(merged, values)[A]
+            values, levels = merged, len(merged)
+            fill = np.searchsorted(values, fill)
+        boundary = fill
+
+    # Same window placement as scipy for even sizes: size // 2 before, the rest after
+    pad = [(s // 2, s - 1 - s // 2) for s in size] + [(0, 0)] * (A.ndim - 2)
+    P = extend(A, pad, boundary)
+
+    H = A.shape[0]
+    starts = range(0, H, strip_rows)
+
+    def strip(r0):
+        r1 = min(r0 + strip_rows, H)
+        S = P[r0:r1 + size[0] - 1]
+        return _median_strip(S, size, levels)
+
+    if workers is None or workers <= 1 or len(starts) == 1:
+        strips = [strip(r0) for r0 in starts]
+    else:
+        with ThreadPoolExecutor(workers) as pool:  # NumPy releases the GIL in the inner loops
+            strips = list(pool.map(strip, starts))
+    J = np.concatenate(strips, axis=0)
+
+    J = J.astype(I.dtype) if values is None else values[J]
+    return np.moveaxis(J, (0, 1), axes)
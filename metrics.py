@@ -0,0 +1,217 @@
+import numpy as np
+
+METRICS = ("NE", "MSE", "PSNR", "SSIM")
+
+# SSIM constants of Wang et al. (2004): Gaussian window of standard deviation 1.5, 11 x 11
+SSIM_SIGMA = 1.5
+SSIM_TRUNCATE = 3.5
+SSIM_K1, SSIM_K2 = 0.01, 0.03
+
+
+def noise_estimation_error(I, J, peak=255.0):
+    """
+    Computes the Noise Estimation Error (NE) between a reference image and an estimate.
+
+    Parameters:
+    - I (numpy.ndarray): Reference image.
+    - J (numpy.ndarray): Estimated image, same shape as I.
+    - peak (float): Value of white: 255 for 8-bit data (default), 1 for normalized images.
+
+    Returns:
+    - float: sqrt(sum(((J - I) / peak) ** 2)).
+    """
+    if I.shape != J.shape:
+        raise ValueError(f"noise_estimation_error: Shape mismatch {I.shape} vs {J.shape}")
+
+    diff = np.subtract(J, I, dtype=np.float64)
+    if peak != 1:
+        diff /= peak
+    return float(np.sqrt(np.vdot(diff, diff)))
+
+
+def psnr(I, J, peak=255.0):
+    """
+    Computes the Peak Signal-to-Noise Ratio (PSNR) of an estimate, in dB.
+
+    Parameters:
+    - I (numpy.ndarray): Reference image.
+    - J (numpy.ndarray): Estimated image, same shape as I.
+    - peak (float): Value of white: 255 for 8-bit data (default), 1 for normalized images.
+
+    Returns:
+    - float: 10 * log10(peak ** 2 / MSE), or inf for identical images.
+    """
+    if I.shape != J.shape:
+        raise ValueError(f"psnr: Shape mismatch {I.shape} vs {J.shape}")
+
+    diff = np.subtract(J, I, dtype=np.float64)
+    mse = np.vdot(diff, diff) / diff.size
+    return float(10 * np.log10(peak ** 2 / mse)) if mse > 0 else float("inf")
+
+
+def ssim_radius(sigma=SSIM_SIGMA):
+    """Rows/columns on each side of a pixel read by the SSIM window (overlap for tiled use)."""
+    return int(SSIM_TRUNCATE * sigma + 0.5)
+
+
+def _local_mean(x, sigma):
+    # Gaussian-weighted local mean over the two spatial axes (channels are independent)
+    from scipy.ndimage import gaussian_filter
+
+    return gaussian_filter(x, (sigma, sigma) + (0,) * (x.ndim - 2), truncate=SSIM_TRUNCATE)
+
+
+def _ssim_stats(x, sigma):
+    """Local mean and variance of x."""
+    mu = _local_mean(x, sigma)
+    var = _local_mean(np.square(x), sigma)
+    var -= np.square(mu)
+    return mu, var
+
+
+def _ssim_map(x, y, peak, sigma, x_stats=None):
+    """
+    Per-pixel SSIM of two floating-point images (Gaussian window, 'reflect' borders).
+    x_stats = _ssim_stats(x, sigma) may be passed to reuse it across several y.
+    """
+    c1, c2 = (SSIM_K1 * peak) ** 2, (SSIM_K2 * peak) ** 2
+    mu_x, var_x = _ssim_stats(x, sigma) if x_stats is None else x_stats
+    mu_y, var_y = _ssim_stats(y, sigma)
+
+    cov = _local_mean(x * y, sigma)
+    mu_xy = mu_x * mu_y
+    cov -= mu_xy
+    # ((2 mu_x mu_y + c1) (2 cov + c2)) / ((mu_x^2 + mu_y^2 + c1) (var_x + var_y + c2))
+    num = mu_xy
+    num *= 2
+    num += c1
+    cov *= 2
+    cov += c2
+    num *= cov
+    den = np.square(mu_y, out=mu_y)
+    den += np.square(mu_x)
+    den += c1
+    var_y += var_x
+    var_y += c2
+    den *= var_y
+    num /= den
+    return num
+
+
+def ssim(I, J, peak=255.0, sigma=SSIM_SIGMA, dtype=np.float32):
+    """
+    Computes the Structural Similarity index (SSIM, Wang et al. 2004) of an estimate.
+
+    Parameters:
+    - I (numpy.ndarray): Reference image (H x W or H x W x C; channels are averaged).
+    - J (numpy.ndarray): Estimated image, same shape as I.
+    - peak (float): Value of white: 255 for 8-bit data (default), 1 for normalized images.
+    - sigma (float): Standard deviation of the Gaussian window.
+    - dtype: Working precision (default: np.float32).
+
+    Returns:
+    - float: Mean SSIM, 1 for identical images.
+    """
+    if I.shape != J.shape:
+        raise ValueError(f"ssim: Shape mismatch {I.shape} vs {J.shape}")
+    x = np.asarray(I).astype(dtype, copy=False)
+    y = np.asarray(J).astype(dtype, copy=False)
+    return float(_ssim_map(x, y, peak, sigma).mean(dtype=np.float64))
+
+
+class MetricsAccumulator:
+    """
+    Accumulates NE, MSE, PSNR and SSIM of several candidates against one reference, tile by
+    tile, for images too large to score in one piece.
+
+    Parameters:
+    - peak (float): Value of white: 255 for 8-bit data (default), 1 for normalized images.
+    - metrics (tuple): Metrics to compute, out of METRICS.
+    - dtype: Working precision (default: np.float32); sums are accumulated in float64.
+    - sigma (float): SSIM window standard deviation.
+    """
+
+    def __init__(self, peak=255.0, metrics=METRICS, dtype=np.float32, sigma=SSIM_SIGMA):
+        unknown = set(metrics) - set(METRICS)
+        if unknown:
+            raise ValueError(f"MetricsAccumulator: Unknown metrics {sorted(unknown)}")
+        self.peak, self.metrics, self.dtype, self.sigma = peak, tuple(metrics), dtype, sigma
+        self._sse = {}
+        self._ssim = {}
+        self._count = 0
+
+    def update(self, reference, candidates, rows=slice(None)):
+        """
+        Adds one tile.
+
+        Parameters:
+        - reference (numpy.ndarray): Reference tile.
+        - candidates (dict): Candidate name -> tile of the same shape.
+        - rows (slice): Rows of the tile to count; the others are only read as SSIM context
+          (overlap with the neighbouring tiles, ssim_radius(sigma) rows).
+        """
+        x = np.asarray(reference).astype(self.dtype, copy=False)
+        counted = x[rows]
+        self._count += counted.size
+        x_stats = _ssim_stats(x, self.sigma) if "SSIM" in self.metrics else None
+        buf = np.empty_like(counted)
+
+        for name, J in candidates.items():
+            if J.shape != x.shape:
+                raise ValueError(f"MetricsAccumulator: Shape mismatch {x.shape} vs {J.shape} for '{name}'")
+            np.subtract(J[rows], counted, out=buf, dtype=self.dtype)
+            np.square(buf, out=buf)
+            self._sse[name] = self._sse.get(name, 0.0) + float(buf.sum(dtype=np.float64))
+            if x_stats is not None:
+                y = np.asarray(J).astype(self.dtype, copy=False)
+                s = _ssim_map(x, y, self.peak, self.sigma, x_stats)[rows]
+                self._ssim[name] = self._ssim.get(name, 0.0) + float(s.sum(dtype=np.float64))
+
+    def result(self):
+        """Returns {candidate: {metric: value}} for everything added so far."""
+        out = {}
+        for name, sse in self._sse.items():
+            mse = sse / self._count
+            values = {"NE": float(np.sqrt(sse)) / self.peak, "MSE": mse,
+                      "PSNR": float(10 * np.log10(self.peak ** 2 / mse)) if mse > 0 else float("inf")}
+            if "SSIM" in self.metrics:
+                values["SSIM"] = self._ssim[name] / self._count
+            out[name] = {m: values[m] for m in self.metrics}
+        return out
+
+
+def compare(reference, candidates, peak=255.0, metrics=METRICS, dtype=np.float32, strip_rows=None):
+    """
+    Scores many candidate outputs against one reference in a single pass.
+
+    The reference is converted, and its SSIM statistics computed, once; each candidate costs
+    one difference buffer (plus three Gaussian filters for SSIM).
+
+    Parameters:
+    - reference (numpy.ndarray): Reference image (may be a np.memmap).
+    - candidates (dict or sequence): Candidate name -> image, or a sequence/stack of images
+      (named 0, 1, ...), all with the shape of the reference.
+    - peak (float): Value of white: 255 for 8-bit data (default), 1 for normalized images.
+    - metrics (tuple): Metrics to compute, out of METRICS.
+    - dtype: Working precision (default: np.float32); sums are accumulated in float64.
+    - strip_rows (int, optional): Score strips of this many rows at a time, overlapping by the
+      SSIM radius, so that only one strip is ever held in floating point; same result.
+
+    Returns:
+    - dict: {candidate name: {metric: value}}.
+    """
+    if not isinstance(candidates, dict):
+        candidates = dict(enumerate(candidates))
+    acc = MetricsAccumulator(peak, metrics, dtype)
+    H = reference.shape[0]
+    if strip_rows is None or strip_rows >= H:
+        acc.update(reference, candidates)
+        return acc.result()
+
+    halo = ssim_radius(acc.sigma) if "SSIM" in acc.metrics else 0
+    for r0 in range(0, H, strip_rows):
+        r1 = min(r0 + strip_rows, H)
+        a0, a1 = max(r0 - halo, 0), min(r1 + halo, H)
+        acc.update(reference[a0:a1], {name: J[a0:a1] for name, J in candidates.items()},
+                   rows=slice(r0 - a0, r1 - a0))
+    return acc.result()
@@ -0,0 +1,148 @@
+import os
+
+import numpy as np
+
+from apply_padding import padarray
+from boundary import boundary_mode
+from im_smooth import imsmooth, smoothing_radius
+from perona_malik import perona_malik
+from variational_denoiser import variational_denoiser
+
+
+def open_image_memmap(path, shape=None, dtype=None, mode="r"):
+    """
+    Opens an image file as a memory-mapped array.
+
+    Parameters:
+    - path (str): '.npy' file, '.tif'/'.tiff' file (requires the tifffile package) or raw file.
+    - shape (tuple, optional): Array shape; required for raw files and when creating a file.
+    - dtype (optional): Array dtype; required for raw files and when creating a file.
+    - mode (str): 'r' (read-only), 'r+' (read/write) or 'w+' (create or overwrite).
+
+    Returns:
+    - numpy.memmap: The mapped array.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    creating = mode == "w+"
+    if creating and (shape is None or dtype is None):
+        raise ValueError("open_image_memmap: shape and dtype are required to create a file")
+
+    if ext == ".npy":
+        return np.lib.format.open_memmap(path, mode=mode, dtype=dtype, shape=shape)
+
+    if ext in (".tif", ".tiff"):
+        try:
+            import tifffile
+        except ImportError as e:
+            raise ImportError("open_image_memmap: TIFF files require the 'tifffile' package") from e
+        if creating:
+            return tifffile.memmap(path, shape=shape, dtype=dtype)
+        return tifffile.memmap(path, mode=mode)
+
+    if shape is None or dtype is None:
+        raise ValueError("open_image_memmap: shape and dtype are required for raw files")
+    return np.memmap(path, dtype=dtype, mode=mode, shape=shape)
+
+
+def process_strips(src, dst, func, overlap, strip_rows=1024, padval="replicate"):
+    """
+    Applies func to an image in horizontal strips, reading and writing one strip at a time.
+
+    Each strip is read with 'overlap' extra rows above and below. At the top and bottom of the
+    image, where no such rows exist, the strip is padded with padarray using padval, so strip
+    boundaries are invisible and the image edges follow padarray's semantics; with 'circular'
+    the missing rows are read from the opposite end of the image.
+
+    Parameters:
+    - src (array-like): Input image (H x W [x C]); may be a np.memmap.
+    - dst (array-like): Output array with the same number of rows; may be a np.memmap.
+    - func (callable): Maps a strip to a filtered strip of the same number of rows.
+    - overlap (int): Rows func reads on each side of an output row.
+    - strip_rows (int): Output rows per strip; peak memory scales with strip_rows + 2*overlap.
+    - padval (int, float, str or None): padarray value or mode ('replicate', 'reflect',
+      'symmetric', 'circular') at the image edges; None leaves the edges to func.
+
+    Returns:
+    - dst.
+    """
+    H = src.shape[0]
+    if dst.shape[0] != H:
+        raise ValueError("process_strips: Source and destination must have the same number of rows")
+    if strip_rows <= 0 or overlap < 0:
+        raise ValueError("process_strips: strip_rows must be positive and overlap non-negative")
+
+    for r0 in range(0, H, strip_rows):
+        r1 = min(r0 + strip_rows, H)
+        a0, a1 = max(r0 - overlap, 0), min(r1 + overlap, H)
+        strip = np.asarray(src[a0:a1])
+        pre, post = overlap - (r0 - a0), overlap - (a1 - r1)
+
+        if padval is not None and (pre or post) and boundary_mode(padval)[0] == "circular":
+            # The rows beyond the top edge are the last rows of the image, and vice versa:
+            # padding the strip with itself would wrap it onto its own rows
+            strip = np.asarray(src[np.arange(r0 - overlap, r1 + overlap) % H])
+            top = overlap
+        elif padval is not None:
+            zeros = (0,) * (strip.ndim - 1)
+            if pre:
+                strip = padarray(strip, (pre,) + zeros, padval, direction="pre")
+            if post:
+                strip = padarray(strip, (post,) + zeros, padval, direction="post")
+            top = overlap
+        else:
+            top = r0 - a0
+
+        J = func(strip)
+        dst[r0:r1] = J[top:top + (r1 - r0)]
+
+    if hasattr(dst, "flush"):
+        dst.flush()
+    return dst
+
+
+def _edge_padding(boundary):
+    """
+    padval for process_strips when func treats the image edges itself (boundary argument): no
+    padded copy, except for 'circular', whose ghost rows lie at the other end of the image.
+    """
+    return boundary if boundary_mode(boundary)[0] == "circular" else None
+
+
+def imsmooth_out_of_core(src, dst, name="gaussian", *args, strip_rows=1024, padval="replicate"):
+    """
+    imsmooth(src, name, *args, boundary=padval) computed strip by strip into dst (see
+    process_strips); padval sets the boundary of all four image edges.
+    """
+    boundary = "replicate" if padval is None else padval
+    overlap = smoothing_radius(name, *args)
+    return process_strips(src, dst, lambda strip: imsmooth(strip, name, *args, boundary=boundary),
+                          overlap, strip_rows, _edge_padding(boundary))
+
+
+def perona_malik_out_of_core(src, dst, iterations=20, lambda_=0.05, K=15, option=1,
+                             strip_rows=1024, padval="replicate", dtype=np.float64):
+    """
+    perona_malik computed strip by strip into dst. Each explicit step reads one neighbour, so
+    the strips overlap by 'iterations' rows; all four image edges follow padval.
+    """
+    boundary = "circular" if padval is None else padval
+
+    def func(strip):
+        return perona_malik(strip, iterations, lambda_, K, option, dtype=dtype, boundary=boundary)
+    return process_strips(src, dst, func, iterations, strip_rows, _edge_padding(boundary))
+
+
+def variational_out_of_core(src, dst, alpha, k, neta, beta, gamma, nu, lambda_, N,
+                            strip_rows=1024, padval="replicate", dtype=np.float64):
+    """
+    variational_denoiser computed strip by strip into dst, with the per-pixel ('local')
+    weighting: the global weighting depends on whole-image norms and cannot be split in strips.
+    All four image edges follow padval.
+    """
+    boundary = "replicate" if padval is None else padval
+
+    def func(strip):
+        J = variational_denoiser(strip, alpha, k, neta, beta, gamma, nu, lambda_, N,
+                                 weighting="local", dtype=dtype, boundary=boundary)
+        return J[:, :, 0] if strip.ndim == 2 else J
+    return process_strips(src, dst, func, N, strip_rows, _edge_padding(boundary))
@@ -1,13 +1,19 @@
 import numpy as np
 
+from boundary import extend
+
 def pad_for_sliding_filter(im, window_size, padval=0):
     """
     Pads an image for a sliding filter operation, ensuring odd-sized dimensions.
 
+    imsmooth and the PDE solvers treat the border themselves through their boundary argument,
+    so this padded copy is only needed by callers that want the padded array itself.
+
     Parameters:
     - im (numpy.ndarray): Input image.
     - window_size (tuple or list): Size of the filtering window.
-    - padval (int, optional): Padding value (default: 0).
+    - padval (int or str, optional): Padding value (default: 0) or boundary mode
+      ('replicate', 'symmetric', 'reflect', 'circular', see boundary.py).
 
     Returns:
     - numpy.ndarray: Padded image with correct dimensions.
@@ -18,15 +24,15 @@ def pad_for_sliding_filter(im, window_size, padval=0):
     # Compute the required padding (floor of half window size)
     pad = tuple(np.floor(np.array(window_size) / 2).astype(int))
 
-    # Apply padding using the given pad value
-    im = np.pad(im, [(p, p) for p in pad], mode="constant", constant_values=padval)
+    # Apply padding using the given pad value or mode
+    im = extend(im, [(p, p) for p in pad], padval)
 
     # Check for even-sized dimensions
     even = np.mod(window_size, 2) == 0  # True if dimension size is even
 
     # If any dimension is even, remove the extra padding from the first row/column
     if np.any(even):
-        idx = [slice(e, None) for e in even]  # Skip the first row/column if needed
+        idx = [slice(int(e), None) for e in even]  # Skip the first row/column if needed
         im = im[tuple(idx)]
 
     return im
@@ -0,0 +1,266 @@
+import os
+import csv
+import time
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from batch_denoise import DEFAULT_CONFIG, iter_inputs, read_image
+from im_noise import im_noise
+from im_smooth import imsmooth
+from pad_for_sliding_filter import pad_for_sliding_filter
+from perona_malik import perona_malik
+from variational_denoiser import variational_denoiser
+from metrics import compare
+from result_cache import ResultCache
+
+VARIATIONAL_PARAMS = ("alpha", "k", "neta", "beta", "gamma", "nu", "lambda_", "N")
+
+# Parameters of each method and their defaults (those of main.py)
+METHOD_DEFAULTS = {
+    "perona_malik": {**DEFAULT_CONFIG["perona_malik"], "option": 1},
+    "variational": dict(zip(VARIATIONAL_PARAMS, DEFAULT_CONFIG["variational"])),
+}
+# Parameters of the noise -> [pad ->] pre-smoothing prefix shared by all configurations; the
+# boundary is also that of the method
+PREFIX_DEFAULTS = {
+    "noise": DEFAULT_CONFIG["noise"],
+    "window_size": DEFAULT_CONFIG["window_size"],
+    "presmooth_sigma": DEFAULT_CONFIG["presmooth_sigma"],
+    "boundary": DEFAULT_CONFIG["boundary"],
+}
+# Iteration-count parameter of each method; configurations differing only in it share one run
+ITERATIONS = {"perona_malik": "iterations", "variational": "N"}
+
+
+def grid(space):
+    """
+    Every combination of the values of a parameter space.
+
+    Parameters:
+    - space (dict): Parameter name -> list of values.
+
+    Returns:
+    - list of dict: One configuration per combination.
+    """
+    names = list(space)
+    return [dict(zip(names, values)) for values in itertools.product(*(space[n] for n in names))]
+
+
+def random_search(space, n, seed=None):
+    """
+    n random configurations drawn from a parameter space.
+
+    Parameters:
+    - space (dict): Parameter name -> list (uniform choice), (low, high) tuple (uniform; integers
+      if both bounds are ints, bounds included) or callable taking a numpy Generator.
+    - n (int): Number of configurations.
+    - seed (int, optional): Seed of the draws.
+
+    Returns:
+    - list of dict: n configurations.
+    """
+    rng = np.random.default_rng(seed)
+
+    def draw(spec):
+        if callable(spec):
+            return spec(rng)
+        if isinstance(spec, tuple) and len(spec) == 2:
+            low, high = spec
+            if isinstance(low, int) and isinstance(high, int):
+                return int(rng.integers(low, high + 1))
+            return float(rng.uniform(low, high))
+        if isinstance(spec, list):
+            return spec[rng.integers(len(spec))]
+        raise ValueError(f"random_search: Unsupported range {spec!r}")
+
+    return [{name: draw(spec) for name, spec in space.items()} for _ in range(n)]
+
+
+def _prefix(I, noise, window_size, presmooth_sigma, boundary, seed, cache):
+    """Clean grayscale reference, pre-smoothed noisy image and crop, as in batch_denoise."""
+    noise_type, *noise_args = noise
+    A = cache.memoize(im_noise)(I, noise_type, *noise_args, seed=seed)
+    if I.ndim == 3:  # Noise is added before the grayscale conversion, as in main.py
+        I = np.mean(I, axis=2).astype(np.uint8)
+        A = np.mean(A, axis=2).astype(np.uint8)
+    if window_size is None:
+        smooth = cache.memoize(imsmooth)(A, "gaussian", presmooth_sigma, boundary=boundary)
+        return I, smooth, (slice(None), slice(None))
+    padded = cache.memoize(pad_for_sliding_filter)(A, tuple(window_size), padval=0)
+    smooth = cache.memoize(imsmooth)(padded, "gaussian", presmooth_sigma, boundary=boundary)
+    pre = [w // 2 - (1 - w % 2) for w in window_size]
+    crop = tuple(slice(p, p + n) for p, n in zip(pre, I.shape))
+    return I, smooth, crop
+
+
+def _frozen(value):
+    """Lists (and arrays) as tuples, recursively, so that parameter values can key the chains."""
+    if isinstance(value, np.ndarray):
+        value = value.tolist()
+    if isinstance(value, (list, tuple)):
+        return tuple(_frozen(v) for v in value)
+    return value
+
+
+def _run_chain(name, clean, smooth, crop, method, params, counts, boundary="replicate"):
+    """
+    Runs one configuration up to every iteration count in 'counts' (ascending), continuing
+    from the floating-point iterate of the previous count, and scores each checkpoint.
+    """
+    records = []
+    u, done, seconds = None, 0, 0.0
+    for n in counts:
+        t0 = time.perf_counter()
+        if method == "perona_malik":
+            # The explicit scheme only carries the image, so n - done more steps on the
+            # unquantized iterate give exactly the n-step result
+            u = perona_malik(smooth if u is None else u, n - done, params["lambda_"], params["K"],
+                             params["option"], quantize=False, boundary=boundary)
+            J = np.uint8(u)
+        else:
+            data = smooth.astype(np.uint8)  # What variational_denoiser quantizes its input to
+            args = [params[p] for p in VARIATIONAL_PARAMS[:-1]]
+            init = None if u is None else (u[:, :, 0] if data.ndim == 2 else u)
+            u = variational_denoiser(data, *args, n - done, quantize=False, init=init, boundary=boundary)
+            J = np.uint8(u)
+            if data.ndim == 2:
+                J = J[:, :, 0]
+        seconds += time.perf_counter() - t0
+        done = n
+        scores = compare(clean, {"J": J[crop]}, metrics=("NE", "PSNR"))["J"]
+        records.append({**params, ITERATIONS[method]: n, **scores, "seconds": seconds, "image": name})
+    return records
+
+
+def sweep(images, method, configs, output=None, workers=None, seed=0, cache=None):
+    """
+    Evaluates configurations of a denoising method on a set of images, sharing work between them.
+
+    The noisy (optionally padded) and pre-smoothed images are computed once per image and prefix
+    configuration (through a ResultCache). Configurations that differ only in their iteration
+    count run as one chain: the 40-iteration result continues from the 20-iteration one. The
+    chains run on a process pool and their records are yielded, and appended to the output
+    table, as they complete.
+
+    Parameters:
+    - images (list): Image paths, or (name, image) pairs of clean uint8 images.
+    - method (str): 'perona_malik' or 'variational'.
+    - configs (list of dict): Configurations (see grid and random_search); missing method
+      parameters take the values of METHOD_DEFAULTS, and 'noise', 'window_size',
+      'presmooth_sigma' and 'boundary' those of PREFIX_DEFAULTS.
+    - output (str, optional): CSV file receiving one row per record.
+    - workers (int, optional): Worker processes (default: os.cpu_count()); 0 runs inline.
+    - seed (int): Seed of the noise; every image gets its own stream.
+    - cache (ResultCache, optional): Cache for the shared prefixes (default: a new one).
+
+    Yields:
+    - dict: Record with 'image', every parameter, 'NE', 'PSNR' (against the clean image, on the
+      0-255 scale) and 'seconds' (run time of the chain up to this checkpoint).
+    """
+    if method not in METHOD_DEFAULTS:
+        raise ValueError(f"sweep: Unknown method '{method}'")
+    cache = cache or ResultCache()
+    items = [(p, read_image(p)) if isinstance(p, str) else p for p in images]
+    streams = np.random.SeedSequence(seed).spawn(len(items))
+    counter = ITERATIONS[method]
+
+    # Group the configurations into chains sharing everything but the iteration count
+    chains = {}
+    for config in configs:
+        unknown = set(config) - set(METHOD_DEFAULTS[method]) - set(PREFIX_DEFAULTS)
+        if unknown:
+            raise ValueError(f"sweep: Unknown parameters {sorted(unknown)} for '{method}'")
+        prefix = tuple(_frozen(config.get(k, v)) for k, v in PREFIX_DEFAULTS.items())
+        params = {k: _frozen(config.get(k, v)) for k, v in METHOD_DEFAULTS[method].items()}
+        key = (prefix, tuple((k, v) for k, v in params.items() if k != counter))
+        chains.setdefault(key, set()).add(params[counter])
+
+    tasks = []
+    for (name, I), stream in zip(items, streams):
+        prefixes = {}
+        for (prefix, params), counts in chains.items():
+            if prefix not in prefixes:
+                prefixes[prefix] = _prefix(I, *prefix, stream, cache)
+            clean, smooth, crop = prefixes[prefix]
+            labels = dict(zip(PREFIX_DEFAULTS, prefix))
+            tasks.append(((name, clean, smooth, crop, method, dict(params), sorted(counts),
+                           labels["boundary"]), labels))
+
+    fh = writer = None
+    if output is not None:
+        fh = open(output, "w", newline="")
+    try:
+        for records in _execute(tasks, workers):
+            for record in records:
+                if fh is not None:
+                    if writer is None:
+                        writer = csv.DictWriter(fh, fieldnames=list(record))
+                        writer.writeheader()
+                    writer.writerow(record)
+                    fh.flush()
+                yield record
+    finally:
+        if fh is not None:
+            fh.close()
+
+
+def _execute(tasks, workers):
+    """Runs the chains, yielding each one's records (prefix labels first) as it completes."""
+    def labelled(records, labels):
+        return [{"image": r["image"], **labels, **{k: v for k, v in r.items() if k != "image"}}
+                for r in records]
+
+    if workers == 0:
+        for args, labels in tasks:
+            yield labelled(_run_chain(*args), labels)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+        futures = {pool.submit(_run_chain, *args): labels for args, labels in tasks}
+        for future in as_completed(futures):
+            yield labelled(future.result(), futures[future])
+
+
+def _parse_values(text):
+    """'10,20,40' -> [10, 20, 40]; numbers are parsed as int when possible, else float."""
+    values = []
+    for v in text.split(","):
+        try:
+            values.append(int(v))
+        except ValueError:
+            values.append(float(v))
+    return values
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parameter sweep of the PDE denoisers.")
+    parser.add_argument("source", help="directory of images or manifest file (one path per line)")
+    parser.add_argument("method", choices=sorted(METHOD_DEFAULTS))
+    parser.add_argument("-p", "--param", action="append", default=[], metavar="NAME=V1,V2,...",
+                        help="values of one parameter (repeatable), e.g. -p K=5,10,20 -p iterations=20,40")
+    parser.add_argument("--random", type=int, default=None, metavar="N",
+                        help="draw N random configurations between the first and last value of each parameter")
+    parser.add_argument("-o", "--output", default="sweep.csv", help="CSV results table (default: sweep.csv)")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="worker processes (default: CPU count, 0 = run inline)")
+    parser.add_argument("--seed", type=int, default=0, help="noise and random-search seed")
+    args = parser.parse_args(argv)
+
+    space = {}
+    for spec in args.param:
+        name, _, values = spec.partition("=")
+        space[name] = _parse_values(values)
+    if args.random is None:
+        configs = grid(space)
+    else:
+        configs = random_search({k: (v[0], v[-1]) for k, v in space.items()}, args.random, args.seed)
+
+    for record in sweep(iter_inputs(args.source), args.method, configs, args.output, args.workers, args.seed):
+        print(", ".join(f"{k}={v:.4g}" if isinstance(v, float) else f"{k}={v}" for k, v in record.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from boundary import boundary_mode
+from im_noise import im_noise
+from im_smooth import imsmooth, smoothing_radius
+from perona_malik import perona_malik
+from result_cache import ResultCache
+from tiling import clipped_tile, tile_grid
+from variational_denoiser import variational_denoiser
+
+# Tile height and width of the fused passes: the handful of per-tile intermediates of a
+# 256 x 256 tile (plus halo) stay in cache instead of streaming full frames through memory
+TILE_SHAPE = (256, 256)
+
+
+class Node:
+    """
+    One recorded stage: func(*inputs, *args, **kwargs), evaluated lazily by Pipeline.compute.
+
+    radius is the number of neighbouring rows/columns an output pixel depends on; tileable
+    stages can be computed tile by tile from inputs extended by that radius, the others
+    (noise, global norms, periodic boundaries) need whole arrays. Inputs have func None.
+    """
+
+    def __init__(self, func, inputs, args, kwargs, radius, tileable, label):
+        self.func = func
+        self.inputs = inputs
+        self.args = args
+        self.kwargs = kwargs
+        self.radius = radius
+        self.tileable = tileable
+        self.label = label
+
+    def __repr__(self):
+        return f"Node({self.label})"
+
+
+def _local(boundary):
+    """True if a boundary only reads pixels near the image edge (every mode but 'circular')."""
+    return boundary_mode(boundary)[0] != "circular"
+
+
+def _crop(value, region, to):
+    """The part of value, covering the image region 'region', that covers 'to'."""
+    rows, cols = region
+    return value[to[0].start - rows.start:to[0].stop - rows.start,
+                 to[1].start - cols.start:to[1].stop - cols.start]
+
+
+class Pipeline:
+    """
+    Lazy, composable image-processing graph.
+
+    Stages are recorded, not run: each method returns a Node, and recording the same stage on
+    the same inputs twice returns the same Node (common subexpression elimination), so one
+    pre-smoothing feeding five branches is computed once. compute() then evaluates only what
+    the requested outputs need. Chains of tileable stages (pointwise maps, filters, explicit
+    PDE steps with non-periodic boundaries) are fused: every tile of the image is read once with
+    the halo the whole chain needs and pushed through all of its stages, so intermediates never
+    exist as full arrays. Only the requested outputs and the inputs of non-tileable stages are
+    materialized.
+
+    Parameters:
+    - tile_shape (int or tuple): Tile height and width of the fused passes.
+    - workers (int, optional): Threads processing tiles (default: os.cpu_count()).
+
+    Example:
+        p = Pipeline()
+        smooth = p.smooth(p.input("image"), "gaussian", 1.5)
+        out = {"pm": p.perona_malik(smooth, 20, boundary="replicate"),
+               "median": p.smooth(smooth, "median", (3, 3))}
+        results = p.compute(out, image=I)
+    """
+
+    def __init__(self, tile_shape=TILE_SHAPE, workers=None):
+        self.tile_shape = tile_shape
+        self.workers = workers
+        self.inputs = {}
+        self._nodes = {}
+
+    def input(self, name):
+        """Node standing for an array passed to compute() as the keyword argument 'name'."""
+        if name not in self.inputs:
+            self.inputs[name] = Node(None, (), (), {}, 0, False, name)
+        return self.inputs[name]
+
+    def apply(self, func, inputs, *args, radius=0, tileable=True, label=None, **kwargs):
+        """
+        Records func(*inputs, *args, **kwargs).
+
+        Parameters:
+        - func (callable): Stage function; its array arguments come first.
+        - inputs (Node or tuple of Node): Array arguments.
+        - radius (int): Rows/columns on each side an output pixel reads (0 for pointwise maps).
+        - tileable (bool): If False, the stage always runs on whole arrays.
+        - label (str, optional): Name used in statistics (default: func.__name__).
+
+        Returns:
+        - Node: The new stage, or the existing identical one.
+        """
+        inputs = (inputs,) if isinstance(inputs, Node) else tuple(inputs)
+        if not all(isinstance(x, Node) for x in inputs):
+            raise ValueError("Pipeline.apply: Inputs must be nodes of the pipeline")
+        key = (id(func), tuple(id(x) for x in inputs), ResultCache.key("", args, kwargs), radius, tileable)
+        if key not in self._nodes:
+            self._nodes[key] = Node(func, inputs, args, kwargs, radius, tileable,
+                                    label or getattr(func, "__name__", "stage"))
+        return self._nodes[key]
+
+    def pointwise(self, func, inputs, *args, **kwargs):
+        """Records a pointwise map (each output pixel depends on the same input pixel only)."""
+        return self.apply(func, inputs, *args, **kwargs)
+
+    def noise(self, x, stype, a=None, b=None, **kwargs):
+        """Records im_noise (whole-array: the noise streams are not tile-local)."""
+        return self.apply(im_noise, x, stype, a, b, tileable=False, **kwargs)
+
+    def smooth(self, x, name="gaussian", *args, **kwargs):
+        """
+        Records imsmooth; tileable unless batched or with a 'circular' boundary. 'bilateral' is
+        never tileable: OpenCV derives its range weights from the value range of the whole image.
+        """
+        tileable = (_local(kwargs.get("boundary", "replicate")) and not kwargs.get("batch")
+                    and kwargs.get("channel_axis") in (None, -1) and name.lower() != "bilateral")
+        return self.apply(imsmooth, x, name, *args, radius=smoothing_radius(name, *args),
+                          tileable=tileable, label=f"imsmooth_{name}", **kwargs)
+
+    def perona_malik(self, x, iterations=20, lambda_=0.05, K=15, option=1, **kwargs):
+        """
+        Records perona_malik. One explicit step reads direct neighbours, so 'iterations' steps
+        are tileable with that radius, unless the boundary is periodic (the default) or the
+        run stops on a whole-image residual (tol).
+        """
+        tileable = (_local(kwargs.get("boundary", "circular")) and kwargs.get("tol") is None
+                    and not kwargs.get("batch") and not kwargs.get("return_info")
+                    and kwargs.get("channel_axis") in (None, -1))
+        return self.apply(perona_malik, x, iterations, lambda_, K, option, radius=iterations,
+                          tileable=tileable, **kwargs)
+
+    def variational(self, x, alpha, k, neta, beta, gamma, nu, lambda_, N, **kwargs):
+        """
+        Records variational_denoiser. Only the 'local' weighting is tileable (radius N): the
+        'global' weights depend on whole-image norms.
+        """
+        tileable = (kwargs.get("weighting") == "local" and _local(kwargs.get("boundary", "replicate"))
+                    and kwargs.get("tol") is None and not kwargs.get("batch")
+                    and not kwargs.get("return_info") and kwargs.get("channel_axis") in (None, -1))
+        return self.apply(variational_denoiser, x, alpha, k, neta, beta, gamma, nu, lambda_, N,
+                          radius=N, tileable=tileable, **kwargs)
+
+    def _order(self, targets):
+        """Topological order of the nodes the targets depend on."""
+        order, seen = [], set()
+
+        def visit(node):
+            if id(node) in seen:
+                return
+            seen.add(id(node))
+            for x in node.inputs:
+                visit(x)
+            order.append(node)
+
+        for t in targets:
+            visit(t)
+        return order
+
+    def compute(self, outputs, fuse=True, return_stats=False, **values):
+        """
+        Evaluates the requested outputs.
+
+        Parameters:
+        - outputs (Node or dict): One node, or name -> node.
+        - fuse (bool): If False, every stage runs on whole arrays (the unfused reference).
+        - return_stats (bool): If True, also return a dict with 'passes' (fused passes),
+          'materialized' (labels of the stages stored as full arrays) and 'materialized_bytes'.
+        - values: Arrays of the inputs, by name.
+
+        Returns:
+        - numpy.ndarray or dict: The output(s), in the form of 'outputs'; plus stats if requested.
+        """
+        single = isinstance(outputs, Node)
+        targets = {None: outputs} if single else dict(outputs)
+        order = self._order(targets.values())
+
+        # Stored as full arrays: inputs, outputs and whatever a whole-array stage reads
+        materialize = set(id(t) for t in targets.values())
+        for node in order:
+            if node.func is None or not node.tileable or not fuse:
+                materialize.add(id(node))
+                materialize.update(id(x) for x in node.inputs)
+
+        results = {}
+        for node in order:
+            if node.func is None:
+                if node.label not in values:
+                    raise ValueError(f"Pipeline.compute: Missing input '{node.label}'")
+                results[id(node)] = np.asarray(values[node.label])
+        stats = {"passes": 0, "materialized": [], "materialized_bytes": 0}
+
+        pending = [n for n in order if id(n) in materialize and id(n) not in results]
+        while pending:
+            whole = [n for n in pending if not (fuse and n.tileable)
+                     and all(id(x) in results for x in n.inputs)]
+            for node in whole:
+                results[id(node)] = node.func(*(results[id(x)] for x in node.inputs),
+                                              *node.args, **node.kwargs)
+            fused = [n for n in pending if fuse and n.tileable and self._ready(n, results, materialize)]
+            if fused:
+                self._fused_pass(fused, order, results, materialize)
+                stats["passes"] += 1
+            for node in whole + fused:
+                stats["materialized"].append(node.label)
+                stats["materialized_bytes"] += results[id(node)].nbytes
+            pending = [n for n in pending if id(n) not in results]
+
+        out = results[id(outputs)] if single else {k: results[id(n)] for k, n in targets.items()}
+        return (out, stats) if return_stats else out
+
+    @staticmethod
+    def _ready(node, results, materialize):
+        """True if every materialized array the fused chain ending at node reads is available."""
+        stack = list(node.inputs)
+        while stack:
+            x = stack.pop()
+            if id(x) in materialize:
+                if id(x) not in results:
+                    return False
+            else:
+                stack.extend(x.inputs)
+        return True
+
+    def _fused_pass(self, targets, order, results, materialize):
+        """Computes the target nodes, and the unmaterialized stages they need, tile by tile."""
+        members, stack = set(), list(targets)
+        while stack:
+            node = stack.pop()
+            if id(node) not in members:
+                members.add(id(node))
+                stack.extend(x for x in node.inputs if id(x) not in materialize)
+        chain = [n for n in order if id(n) in members]
+        target_ids = set(id(t) for t in targets)
+
+        # Halo of every stage: what its consumers in the chain read around the tile
+        halo = {id(n): 0 for n in chain}
+        for node in reversed(chain):
+            for x in node.inputs:
+                if id(x) in members:
+                    halo[id(x)] = max(halo[id(x)], halo[id(node)] + node.radius)
+
+        shapes = {results[id(x)].shape[:2] for n in chain for x in n.inputs if id(x) not in members}
+        if len(shapes) != 1:
+            raise ValueError(f"Pipeline.compute: Fused stages read arrays of different sizes {sorted(shapes)}")
+        shape = shapes.pop()
+
+        def run(rows, cols, allocate=False):
+            tile = {}
+            for node in chain:
+                region = clipped_tile(rows, cols, halo[id(node)], shape)
+                read = clipped_tile(region[0], region[1], node.radius, shape)
+                args = [_crop(*tile[id(x)], read) if id(x) in members else results[id(x)][read]
+                        for x in node.inputs]
+                value = _crop(node.func(*args, *node.args, **node.kwargs), read, region)
+                tile[id(node)] = (value, region)
+                if id(node) in target_ids:
+                    if allocate:
+                        results[id(node)] = np.empty(shape + value.shape[2:], dtype=value.dtype)
+                    results[id(node)][rows, cols] = _crop(value, region, (rows, cols))
+
+        tiles = tile_grid(shape, self.tile_shape)
+        run(*tiles[0], allocate=True)  # Allocates the outputs from the first tile's dtypes
+        workers = self.workers or os.cpu_count() or 1
+        if workers <= 1 or len(tiles) <= 2:
+            for rows, cols in tiles[1:]:
+                run(rows, cols)
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as pool:  # NumPy releases the GIL
+                list(pool.map(lambda t: run(*t), tiles[1:]))
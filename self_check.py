@@ -0,0 +1,129 @@
+import sys
+import time
+import argparse
+
+import numpy as np
+
+from benchmark import LIBRARY_MODULES, IMPORT_BUDGET, synthetic_image, bench_precision, bench_pyramid, check_imports
+from boundary import BOUNDARY_MODES
+from convolution import convolve2d
+from median_filter import median_filter
+from perona_malik import perona_malik
+from perona_malik_aos import perona_malik_aos
+
+
+def check_import_budget(modules=LIBRARY_MODULES, budget=IMPORT_BUDGET):
+    """Every library module imports within the budget and without OpenCV, SciPy or matplotlib."""
+    for module in modules:  # One at a time, to stop at the first offender
+        r = check_imports((module,), budget)[module]
+        assert not r["heavy"], f"importing '{module}' loads {', '.join(r['heavy'])}"
+        assert r["ok"], f"importing '{module}' takes {r['seconds'] * 1000:.0f} ms (budget {budget * 1000:.0f} ms)"
+
+
+def check_precision(size=256):
+    """float32 pipeline within half an 8-bit step (1/510 on the [0, 1] scale) of float64."""
+    diff = bench_precision(size)["max_abs_diff"]
+    worst = max(diff, key=diff.get)
+    assert diff[worst] <= 1 / 510, f"float32 '{worst}' differs from float64 by {diff[worst]:.3g}"
+
+
+def check_median(size=97, windows=(3, 4, 7, 15), seed=0):
+    """Histogram median equal to scipy.ndimage.median_filter (uint8 and uint16, every boundary)."""
+    from scipy.ndimage import median_filter as scipy_median
+
+    from boundary import ndimage_mode
+
+    rng = np.random.default_rng(seed)
+    cases = {np.uint8: (windows, BOUNDARY_MODES[:-1] + (7,)),
+             np.uint16: (windows[1:2], ("replicate", 7))}  # 65536 levels: slow, so fewer cases
+    for dtype, (sizes, boundaries) in cases.items():
+        I = rng.integers(0, np.iinfo(dtype).max, (size, size + 13), endpoint=True).astype(dtype)
+        for w in sizes:
+            for boundary in boundaries:
+                mode, cval = ndimage_mode(boundary)
+                ref = scipy_median(I, size=w, mode=mode, cval=cval)
+                for workers in (1, 3):
+                    J = median_filter(I, w, workers=workers, strip_rows=16, boundary=boundary)
+                    assert np.array_equal(J, ref), \
+                        f"median {w}x{w} {np.dtype(dtype).name} '{boundary}' workers={workers} differs from scipy"
+
+
+def check_convolution(size=61, seed=0):
+    """convolve2d equal to scipy.ndimage.convolve (to rounding) for every method and boundary."""
+    from scipy.ndimage import convolve
+
+    from kernel import fspecial
+
+    rng = np.random.default_rng(seed)
+    I = rng.random((size, size - 7)) * 255
+    kernels = {"box": fspecial("average", (4, 3)), "separable": fspecial("gaussian", 7, 1.5),
+               "fft": fspecial("disk", 6), "direct": fspecial("laplacian")}
+    for method, kernel in kernels.items():
+        for mode in ("nearest", "reflect", "mirror", "wrap", "constant"):
+            for cval in (0.0, 37.0) if mode == "constant" else (0.0,):
+                ref = convolve(I, kernel, mode=mode, cval=cval)
+                for workers in (None, 3):
+                    J = convolve2d(I, kernel, mode=mode, method=method, cval=cval, workers=workers)
+                    err = float(np.max(np.abs(J - ref)))
+                    assert err <= 1e-9, f"convolve2d '{method}' mode '{mode}' cval {cval} differs by {err:.3g}"
+
+
+def check_aos(size=128, diffusion_time=5.0, lambda_=0.05, K=10, steps=(5, 10, 25, 100)):
+    """
+    AOS converges to the explicit scheme (same reflecting border) as its step count grows, and
+    is within one grey level (RMS) at the explicit time step.
+    """
+    I = synthetic_image(size, np.float64)
+    ref = perona_malik(I, int(round(diffusion_time / lambda_)), lambda_, K, quantize=False,
+                       boundary="replicate")
+    rms = [float(np.sqrt(np.mean((perona_malik_aos(I, diffusion_time, n, K, quantize=False) - ref) ** 2)))
+           for n in steps]
+    assert all(a > b for a, b in zip(rms, rms[1:])), f"AOS error does not shrink with the step count: {rms}"
+    assert rms[-1] < 1.0, f"AOS with {steps[-1]} steps is {rms[-1]:.3g} grey levels (RMS) from explicit"
+
+
+def check_pyramid(size=256):
+    """variational_pyramid within 1% of the NE of 400 plain fine-grid iterations."""
+    results = bench_pyramid(size, iterations=(400,))
+    plain = results["plain N=400"]["ne"]
+    pyramid = next(r["ne"] for label, r in results.items() if label.startswith("pyramid"))
+    assert pyramid <= 1.01 * plain, f"pyramid NE {pyramid:.4g} vs plain {plain:.4g}"
+
+
+CHECKS = {
+    "imports": check_import_budget,
+    "precision": check_precision,
+    "median": check_median,
+    "convolution": check_convolution,
+    "aos": check_aos,
+    "pyramid": check_pyramid,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Equivalence checks of the fast paths against their references.")
+    parser.add_argument("checks", nargs="*", metavar="check",
+                        help=f"checks to run, among {', '.join(CHECKS)} (default: all, in order)")
+    parser.add_argument("--keep-going", action="store_true", help="run every check instead of stopping at the first failure")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.checks if name not in CHECKS]
+    if unknown:
+        parser.error(f"unknown check(s): {', '.join(unknown)}")
+
+    failed = 0
+    for name in args.checks or list(CHECKS):
+        t0 = time.perf_counter()
+        try:
+            CHECKS[name]()
+        except AssertionError as e:
+            failed += 1
+            print(f"{name:>12}: FAIL {e}")
+            if not args.keep_going:
+                break
+        else:
+            print(f"{name:>12}: ok ({time.perf_counter() - t0:.1f} s)")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+def tile_grid(shape, tile_shape):
+    """
+    Splits the first two axes of an array into a grid of tiles.
+
+    Parameters:
+    - shape (tuple): Array shape; only the first two entries are tiled.
+    - tile_shape (int or tuple): Tile height and width.
+
+    Returns:
+    - list of tuple: (row_slice, col_slice) for every tile, in row-major order.
+    """
+    if isinstance(tile_shape, int):
+        tile_shape = (tile_shape, tile_shape)
+    th, tw = tile_shape
+    if th <= 0 or tw <= 0:
+        raise ValueError("tile_grid: Tile shape must be positive")
+
+    H, W = shape[:2]
+    return [(slice(r, min(r + th, H)), slice(c, min(c + tw, W)))
+            for r in range(0, H, th) for c in range(0, W, tw)]
+
+
+def wrapped_tile(A, rows, cols, halo):
+    """
+    Extracts a tile extended by 'halo' pixels on every side, wrapping around the image
+    borders (the periodic boundary of np.roll).
+
+    Parameters:
+    - A (numpy.ndarray): Source array (H x W or H x W x C).
+    - rows, cols (slice): Tile position, as returned by tile_grid.
+    - halo (int): Width of the halo.
+
+    Returns:
+    - numpy.ndarray: Copy of the extended tile, (rows + 2*halo) x (cols + 2*halo) [x C].
+    """
+    H, W = A.shape[:2]
+    r = np.arange(rows.start - halo, rows.stop + halo) % H
+    c = np.arange(cols.start - halo, cols.stop + halo) % W
+    return A[np.ix_(r, c)]
+
+
+def clipped_tile(rows, cols, halo, shape):
+    """
+    A tile extended by 'halo' pixels on every side, clipped to the image, for filters that
+    treat the image border themselves (non-periodic boundaries): the halo only has to cover
+    the tile's neighbours inside the image.
+
+    Parameters:
+    - rows, cols (slice): Tile position, as returned by tile_grid.
+    - halo (int): Width of the halo.
+    - shape (tuple): Image shape; only the first two entries are used.
+
+    Returns:
+    - tuple: (row_slice, col_slice) of the extended tile in the image.
+    """
+    H, W = shape[:2]
+    return (slice(max(rows.start - halo, 0), min(rows.stop + halo, H)),
+            slice(max(cols.start - halo, 0), min(cols.stop + halo, W)))
+
+
+def map_tiles(func, A, halo, tile_shape, axes=(0, 1), periodic=False, workers=None):
+    """
+    Applies a neighbourhood operation tile by tile on a thread pool, writing every tile into
+    one preallocated output.
+
+    Each tile is passed to func extended by 'halo' pixels on every side: clipped to the image
+    (func then treats the image border itself, as it would on the whole image) or, if
+    'periodic', wrapped around it. As long as an output pixel reads no further than the halo,
+    the result is identical to func(A).
+
+    Parameters:
+    - func (callable): Operation on an array, returning an array of the same shape.
+    - A (numpy.ndarray): Input array.
+    - halo (int or tuple): Halo width, or one per axis of 'axes'.
+    - tile_shape (int or tuple): Tile extent along the two axes; None keeps an axis whole.
+    - axes (tuple): The two tiled axes.
+    - periodic (bool): Wrap the halo around the image instead of clipping it.
+    - workers (int, optional): Number of threads (default: os.cpu_count()).
+
+    Returns:
+    - numpy.ndarray: The result, with the dtype func returns.
+    """
+    axes = tuple(a % A.ndim for a in axes)
+    if isinstance(halo, int):
+        halo = (halo, halo)
+    if tile_shape is None or isinstance(tile_shape, int):
+        tile_shape = (tile_shape, tile_shape)
+    size = [A.shape[a] for a in axes]
+    tile_shape = tuple(n if t is None else t for t, n in zip(tile_shape, size))
+    tiles = tile_grid(size, tile_shape)
+    out = None
+
+    def run(rows, cols):
+        nonlocal out
+        block = A
+        inner = [slice(None)] * A.ndim
+        for a, s, h, n in zip(axes, (rows, cols), halo, size):
+            if periodic:
+                block = np.take(block, np.arange(s.start - h, s.stop + h) % n, axis=a)
+                inner[a] = slice(h, h + s.stop - s.start)
+            else:
+                lo, hi = max(s.start - h, 0), min(s.stop + h, n)
+                block = block[(slice(None),) * a + (slice(lo, hi),)]
+                inner[a] = slice(s.start - lo, s.stop - lo)
+        value = func(block)[tuple(inner)]
+        if out is None:  # First tile, run alone: allocates the output
+            out = np.empty(A.shape, dtype=value.dtype)
+        target = [slice(None)] * A.ndim
+        target[axes[0]], target[axes[1]] = rows, cols
+        out[tuple(target)] = value
+
+    run(*tiles[0])
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(tiles) <= 2:
+        for rows, cols in tiles[1:]:
+            run(rows, cols)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:  # The filters release the GIL
+            list(pool.map(lambda t: run(*t), tiles[1:]))
+    return out
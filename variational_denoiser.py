@@ -1,16 +1,209 @@
+import time
+from functools import lru_cache
+
 import numpy as np
 
+import instrumentation
+from boundary import boundary_mode, ghost_cells
+from perona_malik import _reduced, _relative_change, _spatial_axes
+
+@lru_cache(maxsize=None)
+def _neighbours(axis, name="replicate", cval=0.0):
+    """
+    (destination, source) index pairs building the shifted neighbour images c1..c4 of the
+    reference loop out of views of u, for spatial axes (axis, axis + 1). The source of the
+    border row/column follows the boundary mode; it is the value itself for a constant.
+    """
+    ghost = {"replicate": (slice(-1, None), slice(0, 1)), "symmetric": (slice(-1, None), slice(0, 1)),
+             "reflect": (slice(-2, -1), slice(1, 2)), "circular": (slice(0, 1), slice(-1, None))}
+    pairs = []
+    for ax in (axis, axis + 1):
+        lead = (slice(None),) * ax
+        after, before = (cval, cval) if name == "constant" else (lead + (s,) for s in ghost[name])
+        pairs.append(((lead + (slice(None, -1),), lead + (slice(1, None),)),
+                      (lead + (slice(-1, None),), after)))  # c1 / c3: next pixel
+        pairs.append(((lead + (slice(1, None),), lead + (slice(None, -1),)),
+                      (lead + (slice(0, 1),), before)))  # c2 / c4: previous pixel
+    return tuple(pairs)
+
+
+def _at(u, index):
+    """u[index], or the constant itself for the border of a constant boundary."""
+    return u[index] if isinstance(index, tuple) else index
 
-def variational_denoiser(I, alpha, k, neta, beta, gamma, nu, lambda_, N):
+
+def _neighbour_sumsq(u, boundary="replicate", axis=0):
+    """
+    Squared Frobenius norms of c1..c4 from a single full reduction plus the border rows/columns
+    of the spatial axes (axis, axis + 1).
+    """
+    total = np.vdot(u, u)
+    sums = []
+    for axis in (axis, axis + 1):
+        lead = (slice(None),) * axis
+        first, last = u[lead + (0,)], u[lead + (-1,)]
+        before, after = ghost_cells(u, axis, boundary)
+        sums.append(total - np.vdot(first, first) + np.vdot(after, after))
+        sums.append(total - np.vdot(last, last) + np.vdot(before, before))
+    return tuple(sums)
+
+
+def _variational_step(u, I, alpha, k, neta, beta, gamma, lambda_, weighting, acc, tmp, batch=False,
+                      boundary="replicate", axis=None, channel_axis=None, shared=None):
+    """
+    One iteration of the variational scheme, updating u in place (u is B x H x W x Z if batch).
+
+    The spatial axes are (axis, axis + 1) (default: the first two, after the frame axis of a
+    batch). With a channel axis, the 'local' weights are computed once per pixel from the
+    colour difference, in 'shared' (u's shape with one channel), and applied to all channels;
+    the 'global' weights always couple the channels through the image norms.
+    """
+    c = neta * np.sqrt(k)
+    if axis is None:
+        axis = int(batch)
+    neighbours = _neighbours(axis, *boundary_mode(boundary))
+
+    if weighting == "global":
+        if batch:  # One weight per frame, from that frame's norms
+            sums = np.array([_neighbour_sumsq(frame, boundary, axis - 1) for frame in u]).T
+            sums = sums.reshape(sums.shape + (1,) * (u.ndim - 1))
+        else:
+            sums = _neighbour_sumsq(u, boundary, axis)
+        for i, sumsq in enumerate(sums):
+            s = np.sqrt(beta * sumsq + gamma)
+            weight = (s + c) / s
+            out = acc if i == 0 else tmp
+            for dst, src in neighbours[i]:
+                np.multiply(_at(u, src), weight, out=out[dst])
+            if i > 0:
+                acc += tmp
+    else:
+        # Per-pixel weights from the local difference to each neighbour
+        for i, pairs in enumerate(neighbours):
+            out = acc if i == 0 else tmp
+            for dst, src in pairs:
+                np.subtract(_at(u, src), u[dst], out=out[dst])
+            np.square(out, out=out)
+            if channel_axis is None:
+                weight = out
+            else:  # |colour difference| ** 2, shared by the channels
+                weight = np.sum(out, axis=channel_axis, keepdims=True, out=shared)
+            weight *= beta
+            weight += gamma
+            np.sqrt(weight, out=weight)
+            np.divide(c, weight, out=weight)
+            weight += 1
+            for dst, src in pairs:
+                if channel_axis is None:
+                    out[dst] *= _at(u, src)
+                else:
+                    np.multiply(_at(u, src), weight[dst], out=out[dst])
+            if i > 0:
+                acc += tmp
+
+    acc *= lambda_
+    np.subtract(u, I, out=tmp)
+    tmp /= alpha
+    u += acc
+    u -= tmp
+    return u
+
+
+def variational_denoiser(I, alpha, k, neta, beta, gamma, nu, lambda_, N,
+                         engine="inplace", weighting="global", dtype=np.float64,
+                         tol=None, check_every=1, return_info=False, batch=False, quantize=True, init=None,
+                         boundary="replicate", channel_axis=None):
     """
     Variational denoising function
-    :param I: Input image (assumed 8-bit grayscale)
+    :param I: Input image (assumed 8-bit grayscale), or a B x H x W [x C] stack if batch is True
     :param alpha, k, neta, beta, gamma, nu, lambda_: Algorithm parameters
     :param N: Number of iterations
-    :return: Denoised image
+    :param engine: 'inplace' (views and preallocated buffers, one norm reduction per iteration)
+                   or 'reference' (the original loop with shifted copies)
+    :param weighting: 'global' (one weight per neighbour from its image norm, as the reference)
+                      or 'local' (per-pixel weights from the local gradient); 'inplace' engine only
+    :param dtype: Working precision, np.float64 (default) or np.float32
+    :param tol: Stop early once the relative L2 change between iterates drops below tol
+                ('inplace' engine only); N remains the upper bound
+    :param check_every: Evaluate the residual every check_every iterations
+    :param return_info: Also return a dict with 'iterations', 'residuals' and 'converged'
+                        (for a batch, the residual is the largest per-frame value)
+    :param batch: Treat the first axis as frames ('inplace' engine only); every frame keeps its
+                  own global weights, so the result equals running the frames one by one
+    :param quantize: If True (default) the input is truncated to 8 bits and the result cast to
+                     uint8; if False both stay floating point (for float pipelines, where the
+                     parameters are rescaled to the data range, see batch_denoise)
+    :param init: Initial iterate, same shape as I (default: I itself); 'inplace' engine only.
+                 Used by variational_pyramid to start from a prolongated coarse solution
+    :param boundary: Values assumed beyond the image border (see boundary.py): 'replicate'
+                     (default, as the reference), 'symmetric' (the same for one-pixel
+                     neighbours), 'reflect', 'circular' or a constant value; read in place,
+                     without padding. Other than 'replicate'/'symmetric' requires 'inplace'
+    :param channel_axis: Channel axis of a colour/multichannel image, e.g. -1 for interleaved
+                         H x W x C or 0 for planar C x H x W data (counted with the frame axis
+                         for a batch); 'inplace' engine only. The image is processed in its own
+                         layout, without a channel axis being added, and the 'local' weights
+                         are shared by the channels (one per pixel, from the colour difference)
+    :return: Denoised image, or (image, info) if return_info is True
     """
-    I = I.astype(np.uint8)  # Converting into 8-bit image
-    u = I.astype(float)
+    if engine not in ("inplace", "reference"):
+        raise ValueError(f"variational_denoiser: Unknown engine '{engine}'")
+    if tol is not None and engine != "inplace":
+        raise ValueError("variational_denoiser: tol requires the 'inplace' engine")
+    if check_every < 1:
+        raise ValueError("variational_denoiser: check_every must be a positive integer")
+    if weighting not in ("global", "local"):
+        raise ValueError(f"variational_denoiser: Unknown weighting '{weighting}'")
+    if batch and (engine != "inplace" or I.ndim not in (3, 4)):
+        raise ValueError("variational_denoiser: A batch must be a B x H x W [x C] stack on the 'inplace' engine")
+    if init is not None and (engine != "inplace" or np.shape(init) != np.shape(I)):
+        raise ValueError("variational_denoiser: init must match the shape of I on the 'inplace' engine")
+    if boundary_mode(boundary)[0] not in ("replicate", "symmetric") and engine != "inplace":
+        raise ValueError("variational_denoiser: This boundary requires the 'inplace' engine")
+    axis = None
+    if channel_axis is not None:
+        if engine != "inplace" or I.ndim != 3 + batch:
+            raise ValueError("variational_denoiser: channel_axis requires a multichannel image "
+                             "on the 'inplace' engine")
+        try:
+            axis = _spatial_axes(I.ndim, channel_axis, batch)[0]
+        except ValueError as e:
+            raise ValueError(f"variational_denoiser: {e}") from None
+        channel_axis %= I.ndim
+
+    if quantize:
+        I = I.astype(np.uint8)  # Converting into 8-bit image
+    info = {"iterations": N, "residuals": [], "converged": False}
+
+    if engine == "inplace":
+        if I.ndim == 2 + batch and channel_axis is None:  # If grayscale, add a channel dimension
+            I = I[..., np.newaxis]
+            init = None if init is None else init[..., np.newaxis]
+        I_f = I.astype(dtype, copy=False)  # Only read from
+        u = I_f.copy() if init is None else np.array(init, dtype=dtype)
+        acc = np.empty_like(u)
+        tmp = np.empty_like(u)
+        shared = None if channel_axis is None else np.empty(_reduced(u.shape, channel_axis), dtype=dtype)
+        timed = instrumentation.enabled()
+        for n in range(1, N + 1):
+            if timed:
+                t0 = time.perf_counter()
+            _variational_step(u, I_f, alpha, k, neta, beta, gamma, lambda_, weighting, acc, tmp, batch,
+                              boundary, axis, channel_axis, shared)
+            if timed:
+                instrumentation.emit("iteration", solver="variational_denoiser", iteration=n,
+                                     seconds=time.perf_counter() - t0)
+            if tol is not None and n % check_every == 0:
+                np.subtract(acc, tmp, out=acc)  # The increment applied to u by this step
+                info["residuals"].append(_relative_change(acc, u, batch))
+                if info["residuals"][-1] < tol:
+                    info["iterations"] = n
+                    info["converged"] = True
+                    break
+        J = np.uint8(u) if quantize else u
+        return (J, info) if return_info else J
+
+    u = I.astype(dtype)
 
     if len(u.shape) == 2:  # If grayscale, add a third dimension
         u = u[:, :, np.newaxis]  # Convert 2D to 3D (height, width, 1)
@@ -44,5 +237,122 @@ def variational_denoiser(I, alpha, k, neta, beta, gamma, nu, lambda_, N):
         u = u + lambda_ * (del1 * c1 + del2 * c2 + del3 * c3 + del4 * c4) - (u - I[:, :, np.newaxis]) / alpha
 
 
-    denoised_image = np.uint8(u)  # Converting back into 8-bit image
-    return denoised_image
+    denoised_image = np.uint8(u) if quantize else u  # Converting back into 8-bit image
+    return (denoised_image, info) if return_info else denoised_image
+
+
+def _restrict(u):
+    """2 x 2 block mean over the first two axes; odd sizes are padded by replicating the edge."""
+    H, W = u.shape[:2]
+    pad = [(0, H % 2), (0, W % 2)] + [(0, 0)] * (u.ndim - 2)
+    if H % 2 or W % 2:
+        u = np.pad(u, pad, mode="edge")
+    return u.reshape((u.shape[0] // 2, 2, u.shape[1] // 2, 2) + u.shape[2:]).mean(axis=(1, 3))
+
+
+def _prolong(u, shape):
+    """Bilinear interpolation of a _restrict-ed grid back to the finer 'shape' (first two axes)."""
+    for axis, n in enumerate(shape[:2]):
+        m = u.shape[axis]
+        x = np.clip((np.arange(n) + 0.5) / 2 - 0.5, 0, m - 1)  # Fine pixel centres on the coarse grid
+        i0 = np.floor(x).astype(np.intp)
+        i1 = np.minimum(i0 + 1, m - 1)
+        w = (x - i0).reshape((-1,) + (1,) * (u.ndim - axis - 1))
+        u = np.take(u, i0, axis) * (1 - w) + np.take(u, i1, axis) * w
+    return u
+
+
+def _operator(u, alpha, k, neta, beta, gamma, lambda_, weighting):
+    """
+    Left-hand side N(u) = u - G(u) of the fixed-point equation N(u) = I / alpha solved by the
+    iteration u <- G(u) + I / alpha (u is H x W x Z).
+    """
+    w = u.copy()
+    _variational_step(w, np.zeros_like(u), alpha, k, neta, beta, gamma, lambda_, weighting,
+                      np.empty_like(u), np.empty_like(u))
+    return u - w
+
+
+def variational_pyramid(I, alpha, k, neta, beta, gamma, nu, lambda_, N, levels=3,
+                        coarse_iterations=None, cycles=0, weighting="global", dtype=np.float64,
+                        quantize=True):
+    """
+    Coarse-to-fine variational denoising.
+
+    Every iteration of variational_denoiser shrinks the distance to its fixed point by about
+    (1 - 1/alpha), whatever the spatial frequency, so approaching the fixed point takes a few
+    hundred full-resolution iterations. Here the problem is first solved on a pyramid of 2 x 2
+    block means, where iterations are 4**level times cheaper; each finer level starts from
+    its own data plus the prolongated correction of the level below (full multigrid start)
+    and runs N iterations. Optional FAS V-cycles then correct the fine solution with coarse
+    solves of the residual equation.
+
+    Parameters:
+    - I: Input image (8-bit grayscale or H x W x C).
+    - alpha, k, neta, beta, gamma, nu, lambda_: Algorithm parameters, as in variational_denoiser.
+    - N (int): Iterations per level above the coarsest, and smoothing iterations before and
+      after the coarse correction in each V-cycle.
+    - levels (int): Number of coarser levels.
+    - coarse_iterations (int, optional): Iterations on the coarsest level (default: the larger
+      of 4 * alpha, which brings the coarse level close to its fixed point, and N * 4**levels,
+      which costs as much as N full-resolution iterations).
+    - cycles (int): Number of FAS V-cycles run after the coarse-to-fine pass.
+    - weighting: 'global' or 'local', as in variational_denoiser. With 'global' the neighbour
+      norms of a coarse level are scaled to the full-resolution pixel count, with 'local' the
+      neighbour differences to the full-resolution pixel spacing, so every level uses the
+      weights of the fine problem.
+    - dtype: Working precision, np.float64 (default) or np.float32.
+    - quantize (bool): If True (default) the input is truncated to 8 bits and the result cast
+      to uint8.
+
+    Returns:
+    - Denoised image (H x W x Z, like variational_denoiser).
+    """
+    if levels < 0 or cycles < 0:
+        raise ValueError("variational_pyramid: levels and cycles must be non-negative")
+    if coarse_iterations is None:
+        coarse_iterations = max(int(np.ceil(4 * alpha)), N * 4 ** levels)
+
+    data = I.astype(np.uint8) if quantize else I
+    data = data.astype(dtype)
+    if data.ndim == 2:
+        data = data[:, :, np.newaxis]
+
+    def level_params(fine_shape, coarse_shape):
+        ratio = (fine_shape[0] * fine_shape[1]) / (coarse_shape[0] * coarse_shape[1])
+        scaled = beta * ratio if weighting == "global" else beta / ratio
+        return (alpha, k, neta, scaled, gamma, nu, lambda_)
+
+    def solve(u, f, p, iterations):
+        return variational_denoiser(f, *p, iterations, weighting=weighting, dtype=dtype,
+                                    quantize=False, init=u)
+
+    def operator(u, p):
+        a, k_, n_, b, g, _, lam = p
+        return _operator(u, a, k_, n_, b, g, lam, weighting)
+
+    pyramid = [data]
+    for _ in range(levels):
+        pyramid.append(_restrict(pyramid[-1]))
+    level = [level_params(data.shape, f.shape) for f in pyramid]
+
+    u = solve(pyramid[-1], pyramid[-1], level[-1], coarse_iterations)
+    for l in range(levels - 1, -1, -1):
+        u = pyramid[l] + _prolong(u - pyramid[l + 1], pyramid[l].shape)
+        u = solve(u, pyramid[l], level[l], N)
+
+    def v_cycle(u, f, l):
+        if l == levels:
+            return solve(u, f, level[l], coarse_iterations)
+        u = solve(u, f, level[l], N)
+        Ru = _restrict(u)
+        p, pc = level[l], level[l + 1]
+        # FAS: the coarse problem keeps the coarse operator and takes the fine residual as data
+        fc = alpha * (operator(Ru, pc) + _restrict(f / alpha - operator(u, p)))
+        u = u + _prolong(v_cycle(Ru, fc, l + 1) - Ru, u.shape)
+        return solve(u, f, p, N)
+
+    for _ in range(cycles if levels else 0):
+        u = v_cycle(u, data, 0)
+
+    return np.uint8(u) if quantize else u